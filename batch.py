@@ -0,0 +1,198 @@
+# RPG Dice Roller - Batch rolling
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Rolls a file of roll specifications, one JSON object per line as for the
+# server, e.g.
+#   {"id": "goblin 1", "system": "World of Darkness 3rd Ed", "quantity": 7,
+#    "tn": 6}
+#   {"id": "goblin 2", "formula": "2d6+3"}
+# and writes one JSON result per line (see engine.RollResult.asDict()), or an
+# "error" with the line number, in the same order.  Any "id" is echoed back,
+# and with a seed each result has the "streamVersion" it was rolled under (see
+# session.py).
+#
+# The input is read a chunk of lines at a time and the chunks rolled across a
+# pool of worker processes, with only a few chunks in flight at once, so files
+# of any size stream through in bounded memory.  A summary of how fast it went
+# goes to stderr at the end.
+#
+# Usage: python batch.py [INPUT] [--output FILE] [--workers N] [--seed SEED]
+#                        [--chunk-size LINES]
+
+import argparse
+import json
+import multiprocessing
+import sys
+import threading
+import time
+
+import engine
+import rng
+import session
+import simulation
+
+
+# How many lines each worker rolls at a time.
+CHUNK_SIZE = 1000
+
+# How many chunks may be waiting to be rolled or written, per worker.
+PENDING_PER_WORKER = 4
+
+
+# Roll one chunk of lines, returning the output for them as bytes.  This is
+# what the worker processes do.  With a seed, each chunk has its own stream
+# (as in simulation.py), so the output doesn't depend on the number of
+# workers.
+def rollChunk(work):
+    (chunk, firstLine, lines, seed) = work
+    if seed is None:
+        source = rng.createRNG()
+    else:
+        source = rng.createRNG("seeded", simulation.chunkSeed(seed, chunk))
+        source.streamVersion = session.STREAM_VERSION
+    output = list()
+    errors = 0
+    for (i, line) in enumerate(lines):
+        (response, failed) = rollLine(line, firstLine + i, source)
+        if failed:
+            errors = errors + 1
+        output.append(response)
+    output.append("")
+    return ("\n".join(output).encode("utf-8"), len(lines), errors)
+
+
+# The response to one line of input, as JSON, and whether it was an error.
+# Nothing wrong with a line stops the run; it just gets an error.
+def rollLine(line, number, source):
+    requestId = None
+    try:
+        request = json.loads(line)
+        if isinstance(request, dict):
+            requestId = request.get("id")
+        params = engine.parametersFromSpec(request)
+        response = engine.roll(params, source).asDict()
+        if source.streamVersion is not None:
+            response["streamVersion"] = source.streamVersion
+        return (encodeResponse(response, requestId), False)
+    except ValueError as e:
+        error = str(e)
+    except Exception as e:
+        error = "Invalid roll: %s" % e
+    return (encodeResponse({"error": error, "line": number}, requestId),\
+    True)
+
+
+# A response as JSON, with the line's id if it had one.
+def encodeResponse(response, requestId):
+    if requestId is not None:
+        response["id"] = requestId
+    return json.dumps(response)
+
+
+# Split an input file into chunks of lines, skipping blank ones.  Each chunk
+# waits for a slot in "slots" before being handed out, which is what keeps the
+# number in flight bounded.
+def readChunks(inputFile, chunkSize, seed, slots=None):
+    chunk = 0
+    firstLine = 1
+    lines = list()
+    number = 0
+    for line in inputFile:
+        number = number + 1
+        if line.strip() == b"":
+            continue
+        if len(lines) == 0:
+            firstLine = number
+        lines.append(line)
+        if len(lines) >= chunkSize:
+            if slots is not None:
+                slots.acquire()
+            yield (chunk, firstLine, lines, seed)
+            chunk = chunk + 1
+            lines = list()
+    if len(lines) > 0:
+        if slots is not None:
+            slots.acquire()
+        yield (chunk, firstLine, lines, seed)
+
+
+# Roll everything in inputFile, writing the results to outputFile (both
+# binary).  Returns (lines rolled, lines with errors).
+def rollBatch(inputFile, outputFile, workers=None, seed=None,\
+chunkSize=CHUNK_SIZE):
+    rolled = 0
+    errors = 0
+    if workers == 1:
+        for work in readChunks(inputFile, chunkSize, seed):
+            (output, count, failed) = rollChunk(work)
+            outputFile.write(output)
+            rolled = rolled + count
+            errors = errors + failed
+        return (rolled, errors)
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    slots = threading.Semaphore(PENDING_PER_WORKER * workers)
+    chunks = readChunks(inputFile, chunkSize, seed, slots)
+    pool = multiprocessing.Pool(workers)
+    try:
+        # imap() gives the results back in input order.
+        for (output, count, failed) in pool.imap(rollChunk, chunks):
+            outputFile.write(output)
+            slots.release()
+            rolled = rolled + count
+            errors = errors + failed
+    except:
+        # The thread handing out chunks may be waiting for a slot, so don't
+        # wait for it.
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    return (rolled, errors)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=\
+    "Roll a file of JSON roll specifications, one per line.")
+    parser.add_argument("input", nargs="?",\
+    help="the file to read (default stdin)")
+    parser.add_argument("--output", help="write here instead of stdout")
+    parser.add_argument("--workers", type=int,\
+    help="worker processes (default one per CPU)")
+    parser.add_argument("--seed", type=int,\
+    help="roll reproducibly from this seed")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,\
+    help="lines per chunk (default %d)" % CHUNK_SIZE)
+    options = parser.parse_args(arguments)
+    if options.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    inputFile = sys.stdin.buffer
+    if options.input is not None:
+        inputFile = open(options.input, "rb")
+    outputFile = sys.stdout.buffer
+    if options.output is not None:
+        outputFile = open(options.output, "wb")
+
+    started = time.perf_counter()
+    try:
+        (rolled, errors) = rollBatch(inputFile, outputFile, options.workers,\
+        options.seed, options.chunk_size)
+    finally:
+        if inputFile is not sys.stdin.buffer:
+            inputFile.close()
+        if outputFile is not sys.stdout.buffer:
+            outputFile.close()
+        else:
+            outputFile.flush()
+    elapsed = time.perf_counter() - started
+
+    sys.stderr.write("Rolled %d lines (%d errors) in %.2f s: %.0f rolls/s.\n"\
+    % (rolled, errors, elapsed, rolled / elapsed if elapsed > 0 else 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
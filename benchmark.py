@@ -0,0 +1,232 @@
+# RPG Dice Roller - Benchmarks
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Times the roll engine's hot paths: single and batched rolls of every System
+# in the registry across pool sizes from 1 to 100,000 dice, with explosions on
+# and off, plus Free Entry formulas of increasing length.  Results are written
+# as JSON so that runs can be compared to catch regressions.
+#
+# Rolls come from "seeded" sources (see rng.py), one per case and phase keyed
+# on --seed, so runs with the same --seed roll the same dice: the single rolls
+# of a case always draw the same sequence, however many of them the budget
+# allows, and each batch starts from its own fixed stream.
+#
+# --startup also times how long the command line (roller.py) takes to start,
+# roll and exit, compared with an empty Python.
+#
+# Usage: python benchmark.py [--quick] [--budget SECONDS] [--seed SEED]
+#                            [--startup] [--output FILE]
+
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import engine
+import rng
+from systems import registry
+
+
+# The pool sizes to try, and a shorter list for quick runs.
+POOL_SIZES = [1, 10, 100, 1000, 10000, 100000]
+QUICK_POOL_SIZES = [1, 10, 100, 1000]
+
+# The number of sets of dice in the Free Entry formulas to try.
+FORMULA_LENGTHS = [1, 2, 5, 10, 20, 50]
+
+# The poly to use where the System doesn't fix one.
+DEFAULT_POLY = 6
+
+
+# Build the RollParameters for a System with a given pool size, choosing a
+# sensible TN and keep where the System doesn't fix them.
+def benchmarkParameters(system, quantity):
+    poly = system.fixPoly if system.fixPoly >= 0 else DEFAULT_POLY
+    if system.type == "Success-based":
+        tn = poly // 2 + 1
+    else:
+        tn = quantity * (poly + 1) // 2
+    keep = min(quantity, 3)
+    return engine.RollParameters(system, quantity, poly, keep, tn, 0)
+
+
+# The same System with explosions switched on or off.
+def withExplosions(system, explodes):
+    variant = copy.copy(system)
+    variant.maxExplodes = explodes
+    return variant
+
+
+# A Free Entry formula with the given number of sets of dice in it.
+def formulaOfLength(length):
+    terms = list()
+    for i in range(length):
+        terms.append("%dd%d" % (i % 4 + 1, [4, 6, 8, 10, 12, 20][i % 6]))
+    return "+".join(terms) + "+3"
+
+
+# The value below which the given fraction of the (sorted) samples lie.
+def percentile(samples, fraction):
+    index = min(len(samples) - 1, int(fraction * len(samples)))
+    return samples[index]
+
+
+# The source of dice for one phase ("single", "batch" or "memory") of the
+# case numbered "case", which doesn't depend on what came before it.
+def caseSource(seed, case, phase):
+    return rng.createRNG("seeded", "%d/%d/%s" % (seed, case, phase))
+
+
+# Time a set of parameters, both one roll at a time and in a batch, spending
+# roughly "budget" seconds on each.  The dice come from sources for case
+# number "case" of a run with the given seed.
+def timeParameters(params, budget, seed, case):
+    # Single rolls, for latency.
+    latencies = list()
+    source = caseSource(seed, case, "single")
+    started = time.perf_counter()
+    while time.perf_counter() - started < budget or len(latencies) < 3:
+        before = time.perf_counter()
+        engine.roll(params, source)
+        latencies.append(time.perf_counter() - before)
+    latencies.sort()
+
+    # A batch of however many rolls we managed singly, for throughput.
+    batchSize = len(latencies)
+    source = caseSource(seed, case, "batch")
+    before = time.perf_counter()
+    engine.rollMany(params, batchSize, source)
+    batchTime = time.perf_counter() - before
+
+    # Peak memory of a single roll.
+    source = caseSource(seed, case, "memory")
+    tracemalloc.start()
+    engine.roll(params, source)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "singleRollsPerSecond": len(latencies) / sum(latencies),
+        "batchRollsPerSecond": batchSize / batchTime,
+        "batchSize": batchSize,
+        "latency": {
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1],
+        },
+        "peakMemory": peakMemory,
+    }
+
+
+# How many times to start each command when timing startup.
+STARTUP_RUNS = 20
+
+# The commands to time, run with this Python.
+STARTUP_COMMANDS = {
+    "python": ["-c", "pass"],
+    "eval": [os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+    "roller.py"), "eval", "2d6+3"],
+    "roll": [os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+    "roller.py"), "roll", "World of Darkness 3rd Ed", "7", "--tn", "6"],
+}
+
+
+# Time starting each of the STARTUP_COMMANDS as a new process, "runs" times.
+def timeStartup(runs):
+    results = dict()
+    for (name, command) in STARTUP_COMMANDS.items():
+        sys.stderr.write("startup: %s\n" % name)
+        times = list()
+        for i in range(runs):
+            before = time.perf_counter()
+            subprocess.run([sys.executable] + command, check=True,\
+            stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - before)
+        times.sort()
+        results[name] = {"p50": percentile(times, 0.5),\
+        "p90": percentile(times, 0.9), "max": times[-1]}
+    return results
+
+
+# Run every benchmark, returning a list of results.  Progress goes to stderr so
+# that stdout can be kept for the JSON.
+def runBenchmarks(poolSizes, budget, seed):
+    results = list()
+    for system in registry:
+        if system.type == "Free Entry":
+            for length in FORMULA_LENGTHS:
+                formula = formulaOfLength(length)
+                sys.stderr.write("%s: %s\n" % (system.name, formula))
+                params = engine.FreeEntryParameters(system, formula)
+                result = {"system": system.name, "type": system.type,\
+                "formula": formula, "terms": length}
+                result.update(timeParameters(params, budget, seed,\
+                len(results)))
+                results.append(result)
+            continue
+
+        for explodes in (False, True):
+            variant = withExplosions(system, explodes)
+            seen = set()
+            for quantity in poolSizes:
+                params = benchmarkParameters(variant, quantity)
+                # Systems with a fixed quantity only need timing once.
+                if params.quantity in seen:
+                    continue
+                seen.add(params.quantity)
+                sys.stderr.write("%s: %dd%d%s\n" % (system.name,\
+                params.quantity, params.poly, " exploding" if explodes\
+                else ""))
+                result = {"system": system.name, "type": system.type,\
+                "quantity": params.quantity, "poly": params.poly,\
+                "explodes": explodes}
+                result.update(timeParameters(params, budget, seed,\
+                len(results)))
+                results.append(result)
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=\
+    "Benchmark the RPG Dice Roller engine.")
+    parser.add_argument("--quick", action="store_true",\
+    help="only try pools of up to 1,000 dice")
+    parser.add_argument("--budget", type=float, default=0.2,\
+    help="seconds to spend timing each case (default 0.2)")
+    parser.add_argument("--seed", type=int, default=0,\
+    help="seed for the dice (default 0)")
+    parser.add_argument("--startup", action="store_true",\
+    help="also time starting the command line")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    options = parser.parse_args(arguments)
+
+    poolSizes = QUICK_POOL_SIZES if options.quick else POOL_SIZES
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "budget": options.budget,
+        "seed": options.seed,
+        "results": runBenchmarks(poolSizes, options.budget, options.seed),
+    }
+    if options.startup:
+        report["startup"] = timeStartup(STARTUP_RUNS)
+
+    if options.output:
+        output = open(options.output, "w")
+        json.dump(report, output, indent=1)
+        output.close()
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
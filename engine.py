@@ -0,0 +1,608 @@
+# RPG Dice Roller - Roll engine
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# The dice-rolling logic, separated from the GUI so that it can be used by
+# scripts, bots and servers as well as by MainFrame.  Nothing in here depends on
+# wx.
+
+import heapq
+
+import freeentry
+import instrument
+import rng
+import systems
+
+
+# Where rolls are recorded, if anywhere (see rolllog.py and setRollLog()).
+rollLog = None
+
+# Roll & Keep picks out the kept dice with a heap rather than sorting them all
+# when there are at least this many dice per die kept.
+HEAP_KEEP_RATIO = 64
+
+
+# The parameters for a roll of a particular System.  These are parsed and
+# checked once, up front, so that rolling the same thing many times doesn't
+# re-parse anything.  Any values that the System fixes override the values
+# given, in the same way that the GUI locks those boxes.
+class RollParameters:
+    # Constructor.  Values may be given as ints or as strings straight out of a
+    # text box.
+    def __init__(self, system, quantity=None, poly=None, keep=None, tn=None,\
+    addition=None):
+        if system.type == "Free Entry":
+            raise ValueError("Free Entry systems take a formula, not dice " +\
+            "parameters.")
+        self.system = system
+        self.quantity = parseNumber("quantity", quantity, system.fixQuantity)
+        self.poly = parseNumber("poly", poly, system.fixPoly)
+
+        # Keep is only meaningful for "Roll & Keep", where it defaults to
+        # keeping everything.
+        if system.type == "Roll & Keep":
+            self.keep = parseNumber("keep", keep, system.fixKeep,\
+            self.quantity)
+        else:
+            self.keep = None
+
+        # The TN is only needed if there's a target to beat.
+        if system.rollOverUnder != "NoTN":
+            self.tn = parseNumber("target number", tn, system.fixTN)
+        else:
+            self.tn = None
+
+        # Additions are only allowed where the System says so.
+        if system.allowAddition == True:
+            self.addition = parseNumber("addition", addition, -1, 0)
+        else:
+            self.addition = 0
+
+        if self.quantity < 1:
+            raise ValueError("You must roll at least one die.")
+        if self.poly < 1:
+            raise ValueError("Dice must have at least one side.")
+        if self.poly < 2 and system.maxExplodes == True:
+            raise ValueError("Exploding dice must have at least two sides.")
+        if self.keep is not None and self.keep < 1:
+            raise ValueError("You must keep at least one die.")
+
+
+# The parameters for a Free Entry roll, which is just a formula.  The formula
+# is compiled here so that rolling it many times doesn't re-parse it.
+class FreeEntryParameters:
+    # Constructor
+    def __init__(self, system, formula):
+        if system.type != "Free Entry":
+            raise ValueError("Only Free Entry systems take a formula.")
+        self.system = system
+        self.formula = formula
+        self.compiled = freeentry.compileFormula(formula)
+
+
+# The result of a single roll.  "dice" holds every die rolled (after
+# explosions), or is None if the pool was so big that only "counts" (a dict of
+# value to number of dice) were kept.  "kept" holds the dice that counted
+# towards a Roll & Keep total, and
+# "terms" the (roll, dice) pairs of a Free Entry formula.  "comparison" is
+# "less", "more" or "even" against the TN where there was one, and "outcome" is
+# "Success", "Failure" or "Botch" (or None if there was nothing to beat).
+class RollResult:
+    # Constructor
+    def __init__(self, system, dice, total=None, successes=0, botches=0,\
+    comparison=None, outcome=None, kept=None, terms=None, counts=None):
+        self.system = system
+        self.dice = dice
+        self.total = total
+        self.successes = successes
+        self.botches = botches
+        self.comparison = comparison
+        self.outcome = outcome
+        self.kept = kept
+        self.terms = terms
+        self.counts = counts
+        # Where the roll came from, for rolls made by a session.Session, and
+        # the version of the stream contract it was made under.
+        self.seed = None
+        self.counter = None
+        self.streamVersion = None
+
+    # The result as a dict of plain values, e.g. for turning into JSON.
+    def asDict(self):
+        result = {"system": self.system.name, "dice": self.dice,\
+        "total": self.total, "successes": self.successes,\
+        "botches": self.botches, "comparison": self.comparison,\
+        "outcome": self.outcome}
+        if self.dice is None:
+            del result["dice"]
+            result["counts"] = None
+            if self.counts is not None:
+                result["counts"] = dict([(str(value), count) for (value,\
+                count) in sorted(self.counts.items())])
+        if self.kept is not None:
+            result["kept"] = self.kept
+        if self.terms is not None:
+            result["terms"] = [[roll, dice] for (roll, dice) in self.terms]
+            for term in result["terms"]:
+                if isinstance(term[1], dict):
+                    term[1] = dict([(str(value), count) for (value, count)\
+                    in sorted(term[1].items())])
+        if self.counter is not None:
+            result["seed"] = self.seed
+            result["counter"] = self.counter
+            result["streamVersion"] = self.streamVersion
+        return result
+
+
+# Build the parameters for a roll from a dict such as {"system": "World of
+# Darkness 3rd Ed", "quantity": 7, "tn": 6} or {"formula": "2d6+3"}, as sent
+# by bots, servers and batch files.  A formula with no system means Free Entry.
+def parametersFromSpec(spec):
+    if not isinstance(spec, dict):
+        raise ValueError("A roll must be given as an object.")
+    if "formula" in spec:
+        system = systems.findSystem(specSystem(spec, "Free Entry"))
+        return FreeEntryParameters(system, str(spec["formula"]))
+    if "system" not in spec:
+        raise ValueError("No system given.")
+    system = systems.findSystem(specSystem(spec))
+    return RollParameters(system, spec.get("quantity"), spec.get("poly"),\
+    spec.get("keep"), spec.get("tn"), spec.get("addition"))
+
+
+# The name of the System in a roll specification, which must be a string.
+def specSystem(spec, default=None):
+    name = spec.get("system", default)
+    if not isinstance(name, str):
+        raise ValueError("The system must be given as a name.")
+    return name
+
+
+# Turn a user-supplied value into an int.  A fixed value (anything >= 0) always
+# wins; otherwise the given value is used, falling back to the default.
+def parseNumber(name, value, fixed, default=None):
+    if fixed >= 0:
+        return fixed
+    if value is None or (isinstance(value, str) and value.strip() == ""):
+        if default is None:
+            raise ValueError("No %s given." % name)
+        return default
+    # Anything that isn't a number or a string (a list, say, from JSON) isn't
+    # valid either.  Nor is true or false, though Python counts them as ints.
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("%s is not a valid %s." % (value, name))
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("%s is not a valid %s." % (value, name))
+
+
+# Record every roll made from now on in a rolllog.RollLog, or stop recording
+# them if log is None.
+def setRollLog(log):
+    global rollLog
+    rollLog = log
+
+
+# Roll a single die, from the given source of rolls or the session's one.
+def rollDie(poly, source=None):
+    if source is None:
+        source = rng.getRNG()
+    return source.randint(poly)
+
+
+# Roll a batch of dice at once, returning a list of their values.
+def rollDice(poly, count, source=None):
+    if source is None:
+        source = rng.getRNG()
+    return source.draw(poly, count)
+
+
+# Roll the dice described by a set of RollParameters (or FreeEntryParameters)
+# once.  Dice come from the given source (see rng.py), or the session's one.
+# If there's a roll log, the roll is recorded in it.
+def roll(params, source=None):
+    if source is None:
+        source = rng.getRNG()
+    result = rollOnce(params, source)
+    if rollLog is not None:
+        rollLog.append(params, result, source.seed, source.counter,\
+        streamVersion=source.streamVersion)
+    return result
+
+
+# Do the actual work of roll().
+def rollOnce(params, source):
+    system = params.system
+    if system.type == "Free Entry":
+        return rollFormula(system, params.compiled, source)
+    poly = params.poly
+    instrument.countRoll(system, params.quantity)
+
+    # Success-based and Overall Target systems only care how many dice came
+    # up on each face, and Roll & Keep only about the highest (or lowest), so
+    # huge pools are rolled as counts rather than one die at a time.
+    if params.quantity >= rng.COUNTED_POOL_THRESHOLD:
+        if system.type == "Success-based" and\
+        params.poly <= rng.MAX_COUNTED_POLY:
+            return rollSuccessBasedCounts(params, source)
+        if system.type == "Overall Target":
+            return rollOverallCounts(params, source)
+        if system.type == "Roll & Keep" and\
+        params.poly <= rng.MAX_COUNTED_POLY:
+            return rollAndKeepCounts(params, source)
+
+    # Roll up an initial set of dice
+    started = instrument.start()
+    dice = source.draw(poly, params.quantity)
+    instrument.finish("generate", started, system)
+    return scoreDice(params, dice, source)
+
+
+# Score an initial set of dice rolled for a set of RollParameters, rolling any
+# explosions from the given source.  This is the rest of rollOnce(), for
+# callers that draw the dice themselves (see group.py).
+def scoreDice(params, dice, source):
+    system = params.system
+    poly = params.poly
+    successes = 0
+    botches = 0
+
+    # Count minimums and maximums
+    minimums = dice.count(1)
+    maximums = dice.count(poly)
+
+    # Count botches
+    if system.minIsBotch == True:
+        botches = minimums
+
+    # Calculations for the Overall Target family
+    if system.type == "Overall Target":
+        if system.maxExplodes == True:
+            started = instrument.start()
+            dice = explodeOverall(dice, poly, source)
+            instrument.finish("explode", started, system)
+        started = instrument.start()
+        total = sum(dice) + params.addition
+        result = RollResult(system, dice, total, botches=botches)
+        compareWithTarget(result, params.tn)
+
+        # Make maxes a success even if TN > max
+        if result.comparison is not None:
+            if system.maxIsSuccess == True:
+                if (result.successes == 0 and maximums > 0):
+                    result.successes = maximums
+            result.outcome = overallOutcome(result.successes, botches)
+        instrument.finish("score", started, system)
+        return result
+
+    # Calculations for the Success-Based family
+    if system.type == "Success-based":
+        if system.maxExplodes == True:
+            started = instrument.start()
+            dice = explodeSuccessBased(dice, poly, source)
+            instrument.finish("explode", started, system)
+
+        # Count successes
+        started = instrument.start()
+        if system.rollOverUnder == "Over":
+            successes = len([x for x in dice if x >= params.tn])
+        else:
+            successes = len([x for x in dice if x <= params.tn])
+
+        successes = scoreSuccesses(system, successes, minimums, maximums)
+        result = RollResult(system, dice, successes=successes,\
+        botches=botches, outcome=overallOutcome(successes, botches))
+        instrument.finish("score", started, system)
+        return result
+
+    # Calculations for the Roll & Keep family
+    if system.type == "Roll & Keep":
+        if system.maxExplodes == True:
+            started = instrument.start()
+            dice = explodeOverall(dice, poly, source)
+            instrument.finish("explode", started, system)
+
+        # Keep a certain number of dice, lowest ones for "Under" TN, highest
+        # ones for "Over" TN or "NoTN".
+        started = instrument.start()
+        kept = keepDice(dice, params.keep, system.rollOverUnder != "Under")
+        result = RollResult(system, dice, sum(kept), kept=kept)
+        compareWithTarget(result, params.tn)
+        if result.comparison is not None:
+            result.outcome = overallOutcome(result.successes, 0)
+        instrument.finish("score", started, system)
+        return result
+
+    raise ValueError("Unknown system type %s." % system.type)
+
+
+# Roll a Success-based pool as counts of dice per face.  The pool is drawn
+# from the multinomial distribution, explosions are handled a generation at a
+# time on the counts alone, and successes are counted straight off the
+# histogram, so a million dice cost about the same as ten.  The result has
+# "counts" (face -> number of dice) instead of "dice".
+def rollSuccessBasedCounts(params, source):
+    system = params.system
+    poly = params.poly
+    started = instrument.start()
+    counts = source.faceCounts(poly, params.quantity)
+    instrument.finish("generate", started, system)
+    minimums = counts[0]
+    maximums = counts[poly - 1]
+
+    # Calculate explosions
+    if system.maxExplodes == True:
+        started = instrument.start()
+        exploding = maximums
+        generations = 0
+        added = 0
+        while exploding > 0:
+            newCounts = source.faceCounts(poly, exploding)
+            for face in range(poly):
+                counts[face] = counts[face] + newCounts[face]
+            generations = generations + 1
+            added = added + exploding
+            exploding = newCounts[poly - 1]
+        instrument.countExplosions(generations, added)
+        instrument.finish("explode", started, system)
+
+    # Count successes
+    started = instrument.start()
+    if system.rollOverUnder == "Over":
+        successes = sum(counts[max(params.tn, 1) - 1:])
+    else:
+        successes = sum(counts[0:max(params.tn, 0)])
+
+    botches = minimums if system.minIsBotch == True else 0
+    successes = scoreSuccesses(system, successes, minimums, maximums)
+    counts = dict([(face + 1, count) for (face, count) in enumerate(counts)\
+    if count > 0])
+    result = RollResult(system, None, successes=successes, botches=botches,\
+    outcome=overallOutcome(successes, botches), counts=counts)
+    instrument.finish("score", started, system)
+    return result
+
+
+# Roll an Overall Target pool without rolling every die.  The total comes
+# from rng.sumDice(), and each generation of explosions only needs the number
+# of maximums from the one before.  Where the sum is exact the result has
+# "counts" of each final die value (a die that exploded twice and then rolled
+# r is worth 2 * poly + r); for dice with too many sides to count per face
+# (see rng.sumDice()) "counts" is None.
+def rollOverallCounts(params, source):
+    system = params.system
+    poly = params.poly
+    started = instrument.start()
+    (total, minimums, maximums, faces) = source.sumDice(poly, params.quantity)
+    counts = valueCounts(faces, 0, poly)
+    instrument.finish("generate", started, system)
+
+    # Calculate explosions
+    if system.maxExplodes == True:
+        started = instrument.start()
+        if counts is not None:
+            counts.pop(poly, None)
+        exploding = maximums
+        generation = 1
+        added = 0
+        while exploding > 0:
+            added = added + exploding
+            (extra, ignored, exploding, faces) = source.sumDice(poly, exploding)
+            total = total + extra
+            if counts is not None and faces is not None:
+                for (value, count) in valueCounts(faces, generation,\
+                poly).items():
+                    if value % poly != 0:
+                        counts[value] = count
+            else:
+                counts = None
+            generation = generation + 1
+        instrument.countExplosions(generation - 1, added)
+        instrument.finish("explode", started, system)
+
+    started = instrument.start()
+    botches = minimums if system.minIsBotch == True else 0
+    result = RollResult(system, None, total + params.addition,\
+    botches=botches, counts=counts)
+    compareWithTarget(result, params.tn)
+
+    # Make maxes a success even if TN > max
+    if result.comparison is not None:
+        if system.maxIsSuccess == True:
+            if (result.successes == 0 and maximums > 0):
+                result.successes = maximums
+        result.outcome = overallOutcome(result.successes, botches)
+    instrument.finish("score", started, system)
+    return result
+
+
+# Roll a Roll & Keep pool as counts of each final die value, in the same way as
+# rollOverallCounts(), and pick the kept dice straight off the counts, so
+# only the kept dice are ever listed.  The result has "counts" (value -> number
+# of dice) instead of "dice".
+def rollAndKeepCounts(params, source):
+    system = params.system
+    poly = params.poly
+    started = instrument.start()
+    faces = source.faceCounts(poly, params.quantity)
+    counts = valueCounts(faces, 0, poly)
+    instrument.finish("generate", started, system)
+
+    # Calculate explosions
+    if system.maxExplodes == True:
+        started = instrument.start()
+        counts.pop(poly, None)
+        exploding = faces[poly - 1]
+        generation = 1
+        added = 0
+        while exploding > 0:
+            added = added + exploding
+            faces = source.faceCounts(poly, exploding)
+            for (value, count) in valueCounts(faces, generation,\
+            poly).items():
+                if value % poly != 0:
+                    counts[value] = count
+            exploding = faces[poly - 1]
+            generation = generation + 1
+        instrument.countExplosions(generation - 1, added)
+        instrument.finish("explode", started, system)
+
+    started = instrument.start()
+    kept = keepCounts(counts, params.keep, system.rollOverUnder != "Under")
+    result = RollResult(system, None, sum(kept), kept=kept, counts=counts)
+    compareWithTarget(result, params.tn)
+    if result.comparison is not None:
+        result.outcome = overallOutcome(result.successes, 0)
+    instrument.finish("score", started, system)
+    return result
+
+
+# The dice kept from a Roll & Keep pool: the "keep" highest (or lowest, if not
+# "highest"), in that order.  Keeping a few of a lot of dice uses a heap
+# instead of sorting the lot.
+def keepDice(dice, keep, highest):
+    if keep * HEAP_KEEP_RATIO <= len(dice):
+        if highest:
+            return heapq.nlargest(keep, dice)
+        return heapq.nsmallest(keep, dice)
+    return sorted(dice, reverse=highest)[0:keep]
+
+
+# The same for a dict of value -> number of dice.
+def keepCounts(counts, keep, highest):
+    kept = list()
+    for value in sorted(counts, reverse=highest):
+        kept.extend([value] * min(counts[value], keep - len(kept)))
+        if len(kept) >= keep:
+            break
+    return kept
+
+
+# Turn a list of dice per face into a dict of die value -> number of dice, for
+# dice that have already exploded "generation" times.  Returns None if there
+# were no counts.
+def valueCounts(faces, generation, poly):
+    if faces is None:
+        return None
+    return dict([(generation * poly + face + 1, count) for (face, count)\
+    in enumerate(faces) if count > 0])
+
+
+# Apply a Success-based System's rules about minimums and maximums to a raw
+# count of successes.  Minimums and maximums only count the initial dice, not
+# any added by explosions.
+def scoreSuccesses(system, successes, minimums, maximums):
+    # Make maxes a success even if TN > max
+    if system.maxIsSuccess == True:
+        if (successes == 0 and maximums > 0):
+            successes = maximums
+
+    # Double max-values if required
+    if system.maxIsDouble == True:
+        successes = successes + maximums
+
+    # Subtract mins from successes if required
+    if system.minIsMinusSuccess == True:
+        successes = successes - minimums
+    return successes
+
+
+# Roll the same thing many times.  The parameters are only parsed once, so this
+# is the one to use for high-throughput callers.
+def rollMany(params, times, source=None):
+    if source is None:
+        source = rng.getRNG()
+    return [roll(params, source) for i in range(times)]
+
+
+# Compare a result's total against a TN, filling in the comparison and the
+# success count.  Does nothing if there's no TN.
+def compareWithTarget(result, tn):
+    if tn is None:
+        return
+    overUnder = result.system.rollOverUnder
+    if result.total < tn:
+        result.comparison = "less"
+        if overUnder == "Under":
+            result.successes = result.successes + 1
+    if result.total > tn:
+        result.comparison = "more"
+        if overUnder == "Over":
+            result.successes = result.successes + 1
+    if result.total == tn:
+        result.comparison = "even"
+        result.successes = result.successes + 1
+
+
+# Work out the overall outcome from the number of successes and botches.
+def overallOutcome(successes, botches):
+    if successes > 0:
+        return "Success"
+    if botches > 0:
+        return "Botch"
+    return "Failure"
+
+
+# Roll a Free Entry formula such as "2d6+d8*2".  The formula is only parsed
+# the first time it's seen.
+def rollFreeEntry(system, formula, source=None):
+    return rollFormula(system, freeentry.compileFormula(formula), source)
+
+
+# Roll a compiled Free Entry formula.
+def rollFormula(system, compiled, source=None):
+    if source is None:
+        source = rng.getRNG()
+    instrument.countRoll(system, None)
+    started = instrument.start()
+    (total, terms) = compiled.roll(source)
+    instrument.finish("evaluate", started, system)
+    allDice = list()
+    for (roll, dice) in terms:
+        if not isinstance(dice, list):
+            allDice = None
+            break
+        allDice.extend(dice)
+    return RollResult(system, allDice, total, terms=terms)
+
+
+# Calculate dice explosions (Success-based style).  Every maximum adds another
+# die to the end of the pool, which can explode in turn.  We work through one
+# generation of new dice at a time, so huge pools and long chains don't
+# recurse.
+def explodeSuccessBased(dice, poly, source=None):
+    exploding = dice.count(poly)
+    generations = 0
+    added = 0
+    while exploding > 0:
+        newDice = rollDice(poly, exploding, source)
+        dice.extend(newDice)
+        generations = generations + 1
+        added = added + exploding
+        exploding = newDice.count(poly)
+    instrument.countExplosions(generations, added)
+    return dice
+
+
+# Calculate dice explosions (Overall Target and Roll & Keep style).  Every die
+# whose value is a multiple of poly has another die added to it.  Only the dice
+# that exploded last generation are looked at again, and each generation's
+# re-rolls are drawn in one go.
+def explodeOverall(dice, poly, source=None):
+    dice = list(dice)
+    exploding = [i for (i, die) in enumerate(dice) if die%poly == 0]
+    generations = 0
+    added = 0
+    while len(exploding) > 0:
+        generations = generations + 1
+        added = added + len(exploding)
+        stillExploding = list()
+        for (i, extra) in zip(exploding,\
+        rollDice(poly, len(exploding), source)):
+            dice[i] = dice[i] + extra
+            if extra == poly:
+                stillExploding.append(i)
+        exploding = stillExploding
+    instrument.countExplosions(generations, added)
+    return dice
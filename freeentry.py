@@ -0,0 +1,310 @@
+# RPG Dice Roller - Free Entry formulas
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Parses Free Entry strings such as "2d6+d8*2" into a small expression tree of
+# dice and arithmetic, once, so that rolling the same formula again only costs
+# the dice.  Compiled formulas are kept in a bounded LRU cache.
+
+import functools
+import re
+
+import instrument
+import rng
+
+
+# How many compiled formulas to remember.
+CACHE_SIZE = 256
+
+# The biggest number, in bits, that "*" or "^" may make (about 300 digits).
+# Powers can otherwise take forever, and make numbers too long to print.
+MAX_RESULT_BITS = 1000
+
+# How deeply brackets, signs and powers may nest.
+MAX_DEPTH = 100
+
+# Anything that isn't part of a formula is thrown away before parsing.
+unwantedCharacters = re.compile(r"[^0-9d\+\-\*\/\(\)\^]")
+tokenPattern = re.compile(r"\d+|d|[\+\-\*\/\(\)\^]")
+
+
+# A plain number in a formula.
+class Number:
+    # Constructor
+    def __init__(self, value):
+        self.value = value
+
+    # Work out the value of this part of the formula, rolling any dice from
+    # "source" (see rng.py) and appending them to "terms".
+    def evaluate(self, source, terms):
+        return self.value
+
+    # Roughly how many random values evaluating this part of the formula
+    # takes, for judging how long a roll will be.
+    def cost(self):
+        return 0
+
+
+# Some dice in a formula, e.g. "3d6".  Each evaluation rolls them afresh and
+# records the individual rolls in "terms".  Huge numbers of dice are summed
+# without rolling each one (see rng.sumDice()), and are recorded as a dict of
+# face -> number of dice instead, or None if even that was too big.
+class Dice:
+    # Constructor
+    def __init__(self, quantity, poly):
+        self.quantity = quantity
+        self.poly = poly
+        self.label = "%dd%d" % (quantity, poly)
+
+    # Huge numbers of dice only cost a draw per face, or a few draws if they
+    # are approximated.
+    def cost(self):
+        if self.quantity < rng.COUNTED_POOL_THRESHOLD:
+            return self.quantity
+        if self.poly <= rng.MAX_COUNTED_POLY:
+            return self.poly
+        return 3
+
+    def evaluate(self, source, terms):
+        instrument.countDice(self.quantity)
+        if self.quantity < rng.COUNTED_POOL_THRESHOLD:
+            dice = source.draw(self.poly, self.quantity)
+            terms.append((self.label, dice))
+            return sum(dice)
+        (total, minimums, maximums, faces) = source.sumDice(self.poly,\
+        self.quantity)
+        if faces is None:
+            terms.append((self.label, None))
+        else:
+            terms.append((self.label, dict([(face + 1, count) for (face,\
+            count) in enumerate(faces) if count > 0])))
+        return total
+
+
+# A unary minus (or plus).
+class Negation:
+    # Constructor
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, source, terms):
+        return -self.operand.evaluate(source, terms)
+
+    def cost(self):
+        return self.operand.cost()
+
+
+# Two sub-expressions joined by "^", which raises to a power.
+class BinaryOperation:
+    # Constructor
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    def evaluate(self, source, terms):
+        left = self.left.evaluate(source, terms)
+        right = self.right.evaluate(source, terms)
+        return applyOperator(self.operator, left, right)
+
+    def cost(self):
+        return self.left.cost() + self.right.cost()
+
+
+# A run of sub-expressions joined by "+" and "-", or by "*" and "/", such as
+# "2d6+d8-3", worked through left to right.  Runs are kept flat rather than as
+# a tree of BinaryOperations so that a formula with thousands of terms doesn't
+# recurse once per term.
+class Chain:
+    # Constructor.  "rest" is a list of (operator, sub-expression) pairs.
+    def __init__(self, first, rest):
+        self.first = first
+        self.rest = rest
+
+    def evaluate(self, source, terms):
+        value = self.first.evaluate(source, terms)
+        for (operator, node) in self.rest:
+            value = applyOperator(operator, value, node.evaluate(source,\
+            terms))
+        return value
+
+    def cost(self):
+        cost = self.first.cost()
+        for (operator, node) in self.rest:
+            cost = cost + node.cost()
+        return cost
+
+
+# Work out "left operator right".  Division rounds down, as it always has, and
+# "^" raises to a power.
+def applyOperator(operator, left, right):
+    if operator == "+":
+        return left + right
+    if operator == "-":
+        return left - right
+    if operator == "*":
+        return checkSize(left * right)
+    if operator == "/":
+        if right == 0:
+            raise ValueError("Division by zero in formula.")
+        return left // right
+    if right < 0:
+        raise ValueError("Negative powers aren't supported.")
+    # Check the size before working the power out, rather than after.
+    if abs(left) > 1 and\
+    (abs(left).bit_length() - 1) * right > MAX_RESULT_BITS:
+        raise ValueError("The result of the formula is too big.")
+    return checkSize(left ** right)
+
+
+# Raise a ValueError if a number is bigger than the formula may make.
+def checkSize(value):
+    if abs(value).bit_length() > MAX_RESULT_BITS:
+        raise ValueError("The result of the formula is too big.")
+    return value
+
+
+# A compiled Free Entry formula.
+# "polys" is the set of the different sizes of dice in it; each costs a first
+# block of values (see rng.FIRST_BLOCK) the first time it's rolled, on top of
+# the dice themselves.
+class Formula:
+    # Constructor
+    def __init__(self, text, root, polys):
+        self.text = text
+        self.root = root
+        self.polys = polys
+        self.cost = root.cost() + len(polys) * rng.FIRST_BLOCK
+
+    # Roll the formula, returning the total and the list of (roll, dice) pairs
+    # for each set of dice in it, in the order they were rolled.
+    def roll(self, source):
+        terms = list()
+        total = self.root.evaluate(source, terms)
+        return (total, terms)
+
+
+# Tidy up a Free Entry string the same way every time, so that equivalent
+# inputs share a cache entry.
+def normalise(formula):
+    return unwantedCharacters.sub("", formula.lower())
+
+
+# Compile a Free Entry string, using a cached copy if we've seen it before.
+def compileFormula(formula):
+    started = instrument.start()
+    compiled = compileNormalised(normalise(formula))
+    instrument.finish("parse", started)
+    return compiled
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compileNormalised(text):
+    tokens = tokenPattern.findall(text)
+    if len(tokens) == 0:
+        raise ValueError("The formula is empty.")
+    parser = Parser(tokens)
+    root = parser.parseExpression()
+    if parser.position < len(tokens):
+        raise ValueError("Unexpected %s in formula." %\
+        tokens[parser.position])
+    return Formula(text, root, frozenset(parser.polys))
+
+
+# A recursive descent parser over a list of tokens.  In order of precedence,
+# lowest first:
+#   expression := term (("+" | "-") term)*
+#   term       := unary (("*" | "/") unary)*
+#   unary      := ("-" | "+") unary | power
+#   power      := atom ("^" unary)?
+#   atom       := number | [number] "d" number | "(" expression ")"
+# Every level of nesting goes through a unary, so that's where the depth is
+# limited, well before Python's own recursion limit.
+class Parser:
+    # Constructor
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+        self.polys = set()
+
+    # Look at the next token without using it up.
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    # Use up the next token.
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("The formula ends unexpectedly.")
+        self.position = self.position + 1
+        return token
+
+    def parseExpression(self):
+        return self.parseChain(("+", "-"), self.parseTerm)
+
+    def parseTerm(self):
+        return self.parseChain(("*", "/"), self.parseUnary)
+
+    # Parse a run of sub-expressions (using "parse") joined by any of the
+    # given operators, as a flat Chain if there's more than one.
+    def parseChain(self, operators, parse):
+        first = parse()
+        rest = list()
+        while self.peek() in operators:
+            operator = self.take()
+            rest.append((operator, parse()))
+        if len(rest) == 0:
+            return first
+        return Chain(first, rest)
+
+    def parseUnary(self):
+        self.depth = self.depth + 1
+        if self.depth > MAX_DEPTH:
+            raise ValueError("The formula is nested too deeply.")
+        try:
+            if self.peek() == "-":
+                self.take()
+                return Negation(self.parseUnary())
+            if self.peek() == "+":
+                self.take()
+                return self.parseUnary()
+            return self.parsePower()
+        finally:
+            self.depth = self.depth - 1
+
+    def parsePower(self):
+        node = self.parseAtom()
+        if self.peek() == "^":
+            self.take()
+            node = BinaryOperation("^", node, self.parseUnary())
+        return node
+
+    def parseAtom(self):
+        token = self.take()
+        if token == "(":
+            node = self.parseExpression()
+            if self.take() != ")":
+                raise ValueError("Unmatched bracket in formula.")
+            return node
+        if token == "d":
+            return self.parseDice(1)
+        if token.isdigit():
+            if self.peek() == "d":
+                self.take()
+                return self.parseDice(int(token))
+            return Number(int(token))
+        raise ValueError("Unexpected %s in formula." % token)
+
+    # Parse the number of sides after a "d".
+    def parseDice(self, quantity):
+        token = self.take()
+        if not token.isdigit():
+            raise ValueError("Dice need a number of sides.")
+        poly = int(token)
+        if poly < 1:
+            raise ValueError("Dice must have at least one side.")
+        self.polys.add(poly)
+        return Dice(quantity, poly)
@@ -0,0 +1,231 @@
+# RPG Dice Roller - Group rolls
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Rolls a whole group in one go: two hundred goblins' initiative, or every
+# archer in a mass-combat volley, each member with its own System, pool, TN and
+# addition.  The result is a compact table of everyone's roll, with counts of
+# successes, botches and failures across the group.
+#
+# Members with the same System and dice (quantity, poly and keep) are rolled
+# together: their initial dice are drawn from the source in one go and dealt
+# out, then each member's are scored as engine.roll() would, against its own TN
+# and addition.  So the cost is one draw per kind of member rather than per
+# member.  Huge pools are still rolled one at a time, as counts.
+
+import engine
+import instrument
+import rng
+
+
+# The most members one line or spec can make, so that a typo can't ask for
+# billions of them.
+MAX_MEMBERS = 100000
+
+
+# One member of a group: a name for the table, and the parameters of its roll.
+# Members that roll the same thing can share one set of parameters.
+class Member:
+    # Constructor
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+
+
+# The result of rolling a group.  "rolls" holds a (member, engine.RollResult)
+# pair for each member, in the order given; "successes", "botches" and
+# "failures" count the outcomes, and "untargeted" the rolls with nothing to
+# beat.
+class GroupResult:
+    # Constructor
+    def __init__(self, rolls):
+        self.rolls = rolls
+        # Where the group came from, for groups rolled by a session.Session.
+        self.seed = None
+        self.counter = None
+        self.streamVersion = None
+        self.successes = 0
+        self.botches = 0
+        self.failures = 0
+        self.untargeted = 0
+        for (member, result) in rolls:
+            if result.outcome == "Success":
+                self.successes = self.successes + 1
+            elif result.outcome == "Botch":
+                self.botches = self.botches + 1
+            elif result.outcome == "Failure":
+                self.failures = self.failures + 1
+            else:
+                self.untargeted = self.untargeted + 1
+
+    # The rolls as a table with a line per member.  "Result" is the number of
+    # successes for Success-based systems and the total otherwise.
+    def table(self):
+        rows = [("Name", "System", "Dice", "TN", "Add", "Result", "Outcome")]
+        for (member, result) in self.rolls:
+            params = member.params
+            if params.system.type == "Free Entry":
+                dice = params.formula
+                addition = ""
+            else:
+                dice = describeDice(params)
+                addition = "%+d" % params.addition
+            if params.system.type == "Success-based":
+                score = result.successes
+            else:
+                score = result.total
+            rows.append((member.name, params.system.name, dice,\
+            "" if getattr(params, "tn", None) is None else str(params.tn),\
+            addition, str(score), result.outcome or ""))
+
+        widths = [max([len(row[column]) for row in rows])\
+        for column in range(len(rows[0]))]
+        lines = list()
+        for row in rows:
+            cells = list()
+            for (column, cell) in enumerate(row):
+                # Names and Systems line up on the left, numbers on the right.
+                if column < 2 or column == 6:
+                    cells.append(cell.ljust(widths[column]))
+                else:
+                    cells.append(cell.rjust(widths[column]))
+            lines.append("  ".join(cells).rstrip() + "\n")
+        return "".join(lines)
+
+    # The counts of outcomes as a line of text.
+    def summary(self):
+        text = "%d rolled: %d successes, %d botches, %d failures" %\
+        (len(self.rolls), self.successes, self.botches, self.failures)
+        if self.untargeted > 0:
+            text = text + ", %d with no TN" % self.untargeted
+        return text + ".\n"
+
+    # The result as a dict of plain values, e.g. for turning into JSON.  Each
+    # roll is as engine.RollResult.asDict(), with the member's "name".
+    def asDict(self):
+        rolls = list()
+        for (member, result) in self.rolls:
+            roll = result.asDict()
+            roll["name"] = member.name
+            rolls.append(roll)
+        result = {"rolls": rolls, "successes": self.successes,\
+        "botches": self.botches, "failures": self.failures,\
+        "untargeted": self.untargeted}
+        if self.counter is not None:
+            result["seed"] = self.seed
+            result["counter"] = self.counter
+            result["streamVersion"] = self.streamVersion
+        return result
+
+
+# The dice of a roll for the table, e.g. "7d10" or "8d10k4".
+def describeDice(params):
+    text = "%dd%d" % (params.quantity, params.poly)
+    if params.keep is not None:
+        text = text + "k%d" % params.keep
+    return text
+
+
+# Roll every member of a group, from the given source (see rng.py) or the
+# session's one, returning a GroupResult.  If there's a roll log, each
+# member's roll is recorded in it.
+def rollGroup(members, source=None):
+    if source is None:
+        source = rng.getRNG()
+
+    # Gather up the members that roll the same dice, keeping the order in
+    # which each kind first appears.
+    kinds = dict()
+    results = [None] * len(members)
+    for (i, member) in enumerate(members):
+        params = member.params
+        if params.system.type == "Free Entry" or\
+        params.quantity >= rng.COUNTED_POOL_THRESHOLD:
+            results[i] = engine.rollOnce(params, source)
+            continue
+        key = (params.system.name, params.quantity, params.poly, params.keep)
+        kinds.setdefault(key, list()).append(i)
+
+    for indices in kinds.values():
+        first = members[indices[0]].params
+        quantity = first.quantity
+        started = instrument.start()
+        dice = source.draw(first.poly, quantity * len(indices))
+        instrument.finish("generate", started, first.system)
+        for (n, i) in enumerate(indices):
+            params = members[i].params
+            instrument.countRoll(params.system, quantity)
+            results[i] = engine.scoreDice(params,\
+            dice[n * quantity:(n + 1) * quantity], source)
+
+    if engine.rollLog is not None:
+        for (member, result) in zip(members, results):
+            engine.rollLog.append(member.params, result, source.seed,\
+            source.counter, streamVersion=source.streamVersion)
+    return GroupResult(list(zip(members, results)))
+
+
+# Build the members of a group from a list of dicts, as for
+# engine.parametersFromSpec(), each with an optional "name" (or "id") and
+# "count", e.g.
+#   {"name": "goblin", "count": 200, "system": "d20", "quantity": 1, "tn": 15,
+#    "addition": 2}
+# A spec with a count of more than one makes that many members, numbered.
+def membersFromSpecs(specs):
+    members = list()
+    for (number, spec) in enumerate(specs):
+        params = engine.parametersFromSpec(spec)
+        name = spec.get("name", spec.get("id"))
+        if name is None:
+            name = "#%d" % (number + 1)
+        members.extend(namedMembers(str(name), spec.get("count", 1), params))
+    return members
+
+
+# Build the members of a group of one System from lines of text, as typed
+# into the GUI:
+#   NAME, COUNT, QUANTITY, TN, ADDITION
+# Anything left off or left blank comes from "defaults", a dict of the
+# "quantity", "poly", "keep", "tn" and "addition" to use.  Blank lines are
+# skipped.
+def parseMembers(text, system, defaults):
+    members = list()
+    for (number, line) in enumerate(text.splitlines()):
+        if line.strip() == "":
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) > 5:
+            raise ValueError("Line %d has too many values." % (number + 1))
+        fields = fields + [""] * (5 - len(fields))
+        (name, count, quantity, tn, addition) = fields
+        values = dict(defaults)
+        for (field, value) in (("quantity", quantity), ("tn", tn),\
+        ("addition", addition)):
+            if value != "":
+                values[field] = value
+        try:
+            params = engine.RollParameters(system, values.get("quantity"),\
+            values.get("poly"), values.get("keep"), values.get("tn"),\
+            values.get("addition"))
+            if count == "":
+                count = 1
+            elif count.isdigit():
+                count = int(count)
+            members.extend(namedMembers(name if name != "" else\
+            "#%d" % (number + 1), count, params))
+        except ValueError as e:
+            raise ValueError("Line %d: %s" % (number + 1, e))
+    return members
+
+
+# "count" members rolling the same parameters, numbered if there's more than
+# one.
+def namedMembers(name, count, params):
+    if isinstance(count, bool) or not isinstance(count, int) or count < 0:
+        raise ValueError("%s is not a valid count." % count)
+    if count > MAX_MEMBERS:
+        raise ValueError("A group can have at most %d of each member." %\
+        MAX_MEMBERS)
+    if count == 1:
+        return [Member(name, params)]
+    return [Member("%s %d" % (name, i + 1), params) for i in range(count)]
@@ -0,0 +1,643 @@
+# RPG Dice Roller - GUI
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# The wxPython front end.  This is only imported by roller.py when running the
+# GUI, so that the command line doesn't have to load wx.
+
+# TODO
+# Crit Range (e.g. d20 crits on 19+, 18+ etc.)
+# Shadowrun 4th Ed fail criteria
+
+import wx
+
+import engine
+import group
+import instrument
+import odds
+import render
+import session
+import solver
+import worker
+from systems import registry
+
+
+# Define the main frame of the GUI.
+class MainFrame(wx.Frame):
+    def __init__(self, parent, id, title):
+        # First init a standard wxWidgets Frame.
+        wx.Frame.__init__(self, parent, id, title)
+        
+        # Add the Family and System boxes
+        panel = wx.Panel(self, -1)
+        familyLabel = wx.StaticText(panel, -1, "Family:")
+        systemLabel = wx.StaticText(panel, -1, "System:")
+        self.family = wx.Choice(panel, -1, size=(150,-1))
+        self.family.AppendItems(registry.familyNames())
+        self.family.Bind(wx.EVT_CHOICE,self.familyChanged)
+        self.system = wx.Choice(panel, -1, size=(320,-1))
+        self.system.Bind(wx.EVT_CHOICE,self.systemChanged)
+        self.system.Enable(False)
+        
+        # Add the quantity, keep quantity, poly sides, addition and target 
+        # number boxes
+        quantityLabel = wx.StaticText(panel, -1, "Roll:")
+        keepLabel = wx.StaticText(panel, -1, "Keep:")
+        d = wx.StaticText(panel, -1, "d")
+        plus = wx.StaticText(panel, -1, "+")
+        targetLabel = wx.StaticText(panel, -1, "Target Number:")
+        self.quantity = wx.TextCtrl(panel, -1, "", size=(40,-1))
+        self.keep = wx.TextCtrl(panel, -1, "", size=(40,-1))
+        self.poly = wx.TextCtrl(panel, -1, "", size=(40,-1))
+        self.addition = wx.TextCtrl(panel, -1, "", size=(40,-1))
+        self.target = wx.TextCtrl(panel, -1, "", size=(40,-1))
+        self.quantity.Enable(False)
+        self.keep.Enable(False)
+        self.poly.Enable(False)
+        self.addition.Enable(False)
+        self.target.Enable(False)
+        for box in (self.quantity, self.keep, self.poly, self.addition,\
+        self.target):
+            box.Bind(wx.EVT_TEXT,self.updateOdds)
+        
+        # Add the free entry area
+        freeEntryLabel = wx.StaticText(panel, -1, "Free Entry:")
+        self.freeEntry = wx.TextCtrl(panel, -1, "", size=(300,-1))
+        self.freeEntry.Enable(False)
+        
+        # Add the roll button
+        self.rollButton = wx.Button(panel, -1, "Roll!", size=(80,-1))
+        self.rollButton.Bind(wx.EVT_BUTTON,self.rollDice)
+
+        # Add the button for showing every die of a summarised roll
+        self.detailButton = wx.Button(panel, -1, "All rolls", size=(80,-1))
+        self.detailButton.Bind(wx.EVT_BUTTON,self.showDetail)
+        self.detailButton.Enable(False)
+        self.rendering = None
+
+        # Add the button for working out what's needed for a chance of success
+        self.solveButton = wx.Button(panel, -1, "Solve...", size=(80,-1))
+        self.solveButton.Bind(wx.EVT_BUTTON,self.showSolver)
+        self.solveButton.Enable(False)
+
+        # Add the button for rolling lots of the same System at once
+        self.groupButton = wx.Button(panel, -1, "Group...", size=(80,-1))
+        self.groupButton.Bind(wx.EVT_BUTTON,self.showGroup)
+        self.groupButton.Enable(False)
+
+        # Add the progress bar and Cancel button for big rolls, which are
+        # rolled in the background (see worker.py)
+        self.progress = wx.Gauge(panel, -1, 100, size=(100,-1))
+        self.cancelButton = wx.Button(panel, -1, "Cancel", size=(80,-1))
+        self.cancelButton.Bind(wx.EVT_BUTTON,self.cancelRoll)
+        self.cancelButton.Enable(False)
+        self.job = None
+
+        # Every roll made here is reproducible from the session's seed and
+        # the roll's number.
+        self.session = session.Session()
+        
+        # Add output display
+        self.display = wx.TextCtrl(panel, -1, "", size=(600,100),\
+        style=wx.TE_MULTILINE|wx.TE_RICH)
+
+        # Add the odds of the roll as it stands, which are kept on disk once
+        # worked out.  The common ones are worked out in the background from
+        # the start, picking up where the last run left off.
+        self.odds = wx.StaticText(panel, -1, "", size=(600,-1))
+        self.oddsCache = odds.OddsCache()
+        self.oddsJob = None
+        # The roll whose odds are wanted, by (System name, odds.entryKey()).
+        self.oddsWanted = None
+        self.precomputeJob = worker.BackgroundJob(\
+        lambda job: odds.precompute(self.oddsCache, registry, job),\
+        lambda count: None, lambda error: None, wx.CallAfter).start()
+        self.Bind(wx.EVT_CLOSE,self.closing)
+        
+        self.panel = panel
+
+        # Arrange everything on the GUI
+        topSizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        topSizer.Add(familyLabel, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 0)
+        topSizer.Add(self.family, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        topSizer.Add(systemLabel, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 40)
+        topSizer.Add(self.system, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        
+        entrySizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        entrySizer.Add(quantityLabel, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 0)
+        entrySizer.Add(self.quantity, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(d, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(self.poly, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(plus, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(self.addition, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(keepLabel, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 48)
+        entrySizer.Add(self.keep, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        entrySizer.Add(targetLabel, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 20)
+        entrySizer.Add(self.target, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL, 5)
+        
+        freeEntrySizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        freeEntrySizer.Add(freeEntryLabel, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 0)
+        freeEntrySizer.Add(self.freeEntry, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 5)
+        freeEntrySizer.Add(self.rollButton, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 150)
+        freeEntrySizer.Add(self.detailButton, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 5)
+
+        progressSizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        progressSizer.Add(self.solveButton, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 0)
+        progressSizer.Add(self.groupButton, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 5)
+        progressSizer.Add(self.progress, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 20)
+        progressSizer.Add(self.cancelButton, 0, wx.LEFT|\
+        wx.ALIGN_CENTER_VERTICAL, 5)
+        
+        container = wx.BoxSizer(orient=wx.VERTICAL)
+        container.Add(topSizer, 0, wx.ALL, 10)
+        container.Add(entrySizer, 0, wx.ALL, 10)
+        container.Add(freeEntrySizer, 0, wx.ALL, 10)
+        container.Add(progressSizer, 0, wx.ALIGN_RIGHT|wx.RIGHT, 10)
+        container.Add(self.odds, 0, wx.LEFT|wx.RIGHT, 10)
+        container.Add(self.display, 0, wx.ALL, 10)
+        panel.SetSizerAndFit(container)
+        self.Fit()
+
+    # If the user changes Family, set the contents of the System dropdown
+    # appropriately.
+    def familyChanged(self, event):
+        systemsInThisFamily = registry.inFamily(self.getSelectedFamily())
+        self.system.Clear()
+        for item in systemsInThisFamily:
+            self.system.AppendItems([item.name])
+        # First time around, System is disabled, so Enable it.
+        self.system.Enable(True)
+            
+    # Here's the main GUI reconfiguration work.  Every time a new System is
+    # selected, we need to rearrange the GUI to set fixed things (e.g. World of
+    # Darkness must use d10s) and disable unused things (number of keep dice
+    # outside of "Roll & Keep" systems).
+    def systemChanged(self, event):
+        # Get the selected system
+        selectedSystem = self.getSelectedSystem()
+        
+        # Fiddle with GUI things if it's not Free Entry mode.
+        if selectedSystem.type != "Free Entry":        
+        
+            self.freeEntry.Enable(False)
+            
+            # Enable the Keep box for "Roll & Keep" systems only
+            if selectedSystem.type == "Roll & Keep":
+                if selectedSystem.fixKeep >= 0:
+                    self.keep.SetValue(str(selectedSystem.fixKeep))
+                    self.keep.Enable(False)
+                else:
+                    self.keep.SetValue(self.quantity.GetValue())
+                    self.keep.Enable(True)
+            else:
+                self.keep.SetValue("")
+                self.keep.Enable(False)
+            
+            # Set and Disable the roll quantity if it's fixed.
+            if selectedSystem.fixQuantity >= 0:
+                self.quantity.SetValue(str(selectedSystem.fixQuantity))
+                self.quantity.Enable(False)
+            else:
+                self.quantity.Enable(True)
+            
+            # Set and Disable the poly sides if it's fixed.    
+            if selectedSystem.fixPoly >= 0:
+                self.poly.SetValue(str(selectedSystem.fixPoly))
+                self.poly.Enable(False)
+            else:
+                self.poly.Enable(True)
+            
+            # Set and Disable the target number if it's fixed.
+            if selectedSystem.fixTN >= 0:
+                self.target.SetValue(str(selectedSystem.fixTN))
+                self.target.Enable(False)
+                if selectedSystem.rollOverUnder=="NoTN":
+                    self.target.SetValue("")
+            else:
+                self.target.Enable(True)
+            
+            # Set and Disable the addition if it's not allowed.
+            if selectedSystem.allowAddition == True:
+                self.addition.Enable(True)
+                self.addition.SetValue("0")  
+            else:
+                self.addition.Enable(False)
+                self.addition.SetValue("")
+                
+        else:
+            self.freeEntry.Enable(True)
+            self.quantity.Enable(False)
+            self.quantity.SetValue("")
+            self.poly.Enable(False)
+            self.poly.SetValue("")
+            self.addition.Enable(False)
+            self.addition.SetValue("")
+            self.keep.Enable(False)
+            self.keep.SetValue("")
+            self.target.Enable(False)
+            self.target.SetValue("")
+
+        self.solveButton.Enable(len(solver.variablesFor(selectedSystem)) > 0)
+        self.groupButton.Enable(selectedSystem.type != "Free Entry")
+        self.updateOdds()
+
+    # Show the odds of the roll as it's set up in the boxes, if there are any
+    # to show.  Odds that haven't been worked out yet are worked out in the
+    # background, one roll at a time: the odds can't be stopped half way, so
+    # while one is being worked out, typing only changes which roll is wanted
+    # next, rather than starting yet another thread.
+    def updateOdds(self, event=None):
+        params = self.getOddsParameters()
+        if params is None:
+            self.oddsWanted = None
+            self.odds.SetLabel("")
+            return
+        self.oddsWanted = (params.system.name, odds.entryKey(params))
+        known = self.oddsCache.get(params)
+        if known is not None:
+            self.odds.SetLabel(known.describe(params.system))
+            return
+        self.odds.SetLabel("Odds: working them out...")
+        if self.oddsJob is None:
+            self.oddsJob = worker.BackgroundJob(\
+            lambda job: self.oddsCache.oddsFor(params),\
+            lambda found: self.showOdds(params, found),\
+            lambda error: self.showOdds(params, None), wx.CallAfter).start()
+
+    # Show the odds that have been worked out if they're still wanted, or
+    # otherwise go on to the ones that are.
+    def showOdds(self, params, found):
+        self.oddsJob = None
+        if self.oddsWanted != (params.system.name, odds.entryKey(params)):
+            self.updateOdds()
+        elif found is None:
+            self.odds.SetLabel("")
+        else:
+            self.odds.SetLabel(found.describe(params.system))
+
+    # The parameters in the boxes, or None if they aren't complete (or are too
+    # big to work out the odds of).
+    def getOddsParameters(self):
+        if self.system.GetCurrentSelection() < 0:
+            return None
+        selectedSystem = self.getSelectedSystem()
+        if selectedSystem.type == "Free Entry":
+            return None
+        try:
+            params = engine.RollParameters(selectedSystem,\
+            self.quantity.GetValue(), self.poly.GetValue(),\
+            self.keep.GetValue(), self.target.GetValue(),\
+            self.addition.GetValue())
+        except ValueError:
+            return None
+        if not odds.hasOdds(params):
+            return None
+        return params
+
+    # Stop working out odds and save what's been worked out so far.
+    def closing(self, event):
+        self.precomputeJob.cancel()
+        if self.oddsJob is not None:
+            self.oddsJob.cancel()
+        try:
+            self.oddsCache.save()
+        except OSError:
+            pass
+        event.Skip()
+         
+    # Roll the dice!  All the real work is done by the engine; here we just
+    # read the boxes once and display what comes back.  Big rolls are made in
+    # the background so that the window doesn't freeze.
+    def rollDice(self, event):
+        # Get the selected system (again, we still need it)
+        selectedSystem = self.getSelectedSystem()
+
+        try:
+            if selectedSystem.type == "Free Entry":
+                params = engine.FreeEntryParameters(selectedSystem,\
+                self.freeEntry.GetValue())
+            else:
+                params = engine.RollParameters(selectedSystem,\
+                self.quantity.GetValue(), self.poly.GetValue(),\
+                self.keep.GetValue(), self.target.GetValue(),\
+                self.addition.GetValue())
+            if worker.runsInBackground(params):
+                self.startBackgroundRoll(params)
+                return
+            result = self.session.roll(params)
+        except ValueError as e:
+            self.showError(e)
+            return
+
+        self.showResult(result, render.renderResult(result))
+
+    # Roll (and render) in the background, filling the progress bar as the
+    # dice are drawn and letting the user cancel until it's done.
+    def startBackgroundRoll(self, params):
+        self.rollButton.Enable(False)
+        self.detailButton.Enable(False)
+        self.cancelButton.Enable(True)
+        self.display.SetValue("Rolling...\n")
+        self.job = worker.BackgroundJob(\
+        lambda job: self.rollAndRender(params, job), self.backgroundRollDone,\
+        self.backgroundRollFailed, wx.CallAfter,\
+        onProgress=self.backgroundRollProgress,\
+        onFinished=self.backgroundRollStopped).start()
+
+    # The work done by the background thread.  Nothing in here may touch the
+    # GUI.  The dice are drawn through a worker.WatchedSource, so the roll
+    # reports progress and stops at its next draw if cancelled.
+    def rollAndRender(self, params, job):
+        cost = worker.rollCost(params)
+        result = self.session.roll(params,\
+        lambda source: worker.WatchedSource(source, job, cost))
+        job.checkCancelled()
+        return (result, render.renderResult(result))
+
+    def backgroundRollProgress(self, fraction):
+        self.progress.SetValue(int(fraction * 100))
+
+    def backgroundRollDone(self, rolled):
+        self.finishBackgroundRoll()
+        (result, rendering) = rolled
+        self.showResult(result, rendering)
+
+    def backgroundRollFailed(self, error):
+        self.finishBackgroundRoll()
+        self.showError(error)
+
+    # Stop a background roll.  It stops at its next draw of dice, and still
+    # uses up its number in the session.  Rolling again has to wait until it
+    # has stopped, so that only one roll is ever being made at once.
+    def cancelRoll(self, event):
+        if self.job is not None:
+            self.job.cancel()
+            self.finishBackgroundRoll()
+            self.display.SetValue("Roll cancelled.\n")
+
+    def finishBackgroundRoll(self):
+        self.progress.SetValue(0)
+        self.cancelButton.Enable(False)
+
+    # The background roll's thread has stopped, cancelled or not.
+    def backgroundRollStopped(self):
+        self.job = None
+        self.rollButton.Enable(True)
+
+    def showError(self, error):
+        self.display.SetValue(str(error) + "\n")
+        self.detailButton.Enable(False)
+
+    # Write the result of a roll into the output display, in one go.  Huge
+    # pools are summarised; the "All rolls" button shows them in full.
+    def showResult(self, result, rendering):
+        self.rendering = rendering
+        started = instrument.start()
+        self.display.SetValue(self.rendering.text + describeRoll(result))
+        instrument.finish("display", started, result.system)
+        self.detailButton.Enable(self.rendering.summarised)
+
+    # Show every die of the last roll, even if there are lots of them.
+    def showDetail(self, event):
+        if self.rendering is not None:
+            started = instrument.start()
+            self.display.SetValue(self.rendering.detail())
+            instrument.finish("display", started, self.rendering.result.system)
+            self.detailButton.Enable(False)
+
+    # Open the solver for the selected System, starting from the boxes as
+    # they are.
+    def showSolver(self, event):
+        dialog = SolverDialog(self, self.getSelectedSystem())
+        dialog.ShowModal()
+        dialog.Destroy()
+
+    # Open the group roller for the selected System.
+    def showGroup(self, event):
+        dialog = GroupDialog(self, self.getSelectedSystem())
+        dialog.ShowModal()
+        dialog.Destroy()
+
+    # Returns the instance of System that has been chosen with the drop-downs.
+    def getSelectedSystem(self):
+        systemsInThisFamily = registry.inFamily(self.getSelectedFamily())
+        return systemsInThisFamily[self.system.GetCurrentSelection()]
+
+    # Returns the name of the family that has been chosen with the drop-down.
+    def getSelectedFamily(self):
+        return registry.familyNames()[self.family.GetCurrentSelection()]
+        
+        
+# A dialog for finding the quantity, TN or keep that gives a chance of
+# success (see solver.py), with everything else taken from the main window.
+class SolverDialog(wx.Dialog):
+    def __init__(self, frame, system):
+        wx.Dialog.__init__(self, frame, -1, "Solve for " + system.name)
+        self.frame = frame
+        self.selectedSystem = system
+        self.variables = solver.variablesFor(system)
+        self.job = None
+
+        findLabel = wx.StaticText(self, -1, "Find:")
+        self.variable = wx.Choice(self, -1, size=(150,-1))
+        self.variable.AppendItems([solver.LABELS[variable]\
+        for variable in self.variables])
+        self.variable.SetSelection(0)
+        chanceLabel = wx.StaticText(self, -1, "for a")
+        self.chance = wx.TextCtrl(self, -1, "50", size=(40,-1))
+        percentLabel = wx.StaticText(self, -1, "% chance")
+
+        # Success-based systems can ask for a number of successes.
+        successesLabel = wx.StaticText(self, -1, "of at least")
+        self.successes = wx.TextCtrl(self, -1, "1", size=(40,-1))
+        successesAfter = wx.StaticText(self, -1, "successes")
+        countsSuccesses = system.type == "Success-based"
+        for item in (successesLabel, self.successes, successesAfter):
+            item.Show(countsSuccesses)
+
+        self.findButton = wx.Button(self, -1, "Find", size=(80,-1))
+        self.findButton.Bind(wx.EVT_BUTTON,self.find)
+        self.answer = wx.StaticText(self, -1, "", size=(400,-1))
+        closeButton = wx.Button(self, -1, "Close", size=(80,-1))
+        closeButton.Bind(wx.EVT_BUTTON,self.closing)
+        self.Bind(wx.EVT_CLOSE,self.closing)
+
+        questionSizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        for (item, border) in ((findLabel, 0), (self.variable, 5),\
+        (chanceLabel, 5), (self.chance, 5), (percentLabel, 5),\
+        (successesLabel, 5), (self.successes, 5), (successesAfter, 5)):
+            questionSizer.Add(item, 0, wx.LEFT|wx.ALIGN_CENTER_VERTICAL,\
+            border)
+        buttonSizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        buttonSizer.Add(self.findButton, 0, wx.LEFT, 0)
+        buttonSizer.Add(closeButton, 0, wx.LEFT, 5)
+        container = wx.BoxSizer(orient=wx.VERTICAL)
+        container.Add(questionSizer, 0, wx.ALL, 10)
+        container.Add(self.answer, 0, wx.LEFT|wx.RIGHT, 10)
+        container.Add(buttonSizer, 0, wx.ALL|wx.ALIGN_RIGHT, 10)
+        self.SetSizerAndFit(container)
+
+    # Search in the background, as big pools can take a while to work out.
+    def find(self, event):
+        variable = self.variables[self.variable.GetCurrentSelection()]
+        frame = self.frame
+        values = {"quantity": frame.quantity.GetValue(),\
+        "poly": frame.poly.GetValue(), "keep": frame.keep.GetValue(),\
+        "tn": frame.target.GetValue(), "addition": frame.addition.GetValue()}
+        values[variable] = None
+        successes = None
+        try:
+            chance = float(self.chance.GetValue()) / 100.0
+            if self.selectedSystem.type == "Success-based":
+                successes = int(self.successes.GetValue())
+        except ValueError:
+            self.answer.SetLabel("Please give numbers for the chance and " +\
+            "successes.")
+            return
+        self.findButton.Enable(False)
+        self.answer.SetLabel("Working it out...")
+        self.job = worker.BackgroundJob(lambda job: solver.solve(\
+        self.selectedSystem, variable, chance, values["quantity"],\
+        values["poly"], values["keep"], values["tn"], values["addition"],\
+        successes), self.found, self.failed, wx.CallAfter).start()
+
+    def found(self, solution):
+        self.job = None
+        self.findButton.Enable(True)
+        if solution is None:
+            self.answer.SetLabel("Nothing gives that chance.")
+        else:
+            self.answer.SetLabel(solution.describe())
+
+    def failed(self, error):
+        self.job = None
+        self.findButton.Enable(True)
+        self.answer.SetLabel(str(error))
+
+    # Give up on any search still going when the dialog is closed.
+    def closing(self, event):
+        if self.job is not None:
+            self.job.cancel()
+        self.EndModal(wx.ID_CANCEL)
+
+
+# A dialog for rolling a whole group of the selected System at once (see
+# group.py).  Each line is a kind of member; anything left blank comes from
+# the main window.
+class GroupDialog(wx.Dialog):
+    def __init__(self, frame, system):
+        wx.Dialog.__init__(self, frame, -1, "Roll a group of " + system.name)
+        self.frame = frame
+        self.selectedSystem = system
+
+        helpText = wx.StaticText(self, -1, "One line per kind of member: " +\
+        "name, how many, dice, TN, addition.  Blanks are taken from the " +\
+        "main window.")
+        self.members = wx.TextCtrl(self, -1, "goblin, 10\n", size=(600,100),\
+        style=wx.TE_MULTILINE)
+        self.table = wx.TextCtrl(self, -1, "", size=(600,250),\
+        style=wx.TE_MULTILINE|wx.TE_READONLY|wx.HSCROLL)
+        self.table.SetFont(wx.Font(9, wx.FONTFAMILY_TELETYPE,\
+        wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+        self.summary = wx.StaticText(self, -1, "", size=(600,-1))
+
+        self.rollButton = wx.Button(self, -1, "Roll!", size=(80,-1))
+        self.rollButton.Bind(wx.EVT_BUTTON,self.rollGroup)
+        closeButton = wx.Button(self, -1, "Close", size=(80,-1))
+        closeButton.Bind(wx.EVT_BUTTON,self.closing)
+        self.Bind(wx.EVT_CLOSE,self.closing)
+        self.job = None
+
+        buttonSizer = wx.BoxSizer(orient=wx.HORIZONTAL)
+        buttonSizer.Add(self.rollButton, 0, wx.LEFT, 0)
+        buttonSizer.Add(closeButton, 0, wx.LEFT, 5)
+        container = wx.BoxSizer(orient=wx.VERTICAL)
+        container.Add(helpText, 0, wx.ALL, 10)
+        container.Add(self.members, 0, wx.LEFT|wx.RIGHT, 10)
+        container.Add(buttonSizer, 0, wx.ALL|wx.ALIGN_RIGHT, 10)
+        container.Add(self.table, 0, wx.LEFT|wx.RIGHT, 10)
+        container.Add(self.summary, 0, wx.ALL, 10)
+        self.SetSizerAndFit(container)
+
+    # Roll everybody as the next roll of the main window's session and show
+    # the table.  Big groups are rolled (and tabulated) in the background, as
+    # for big rolls in the main window.
+    def rollGroup(self, event):
+        frame = self.frame
+        defaults = {"quantity": frame.quantity.GetValue(),\
+        "poly": frame.poly.GetValue(), "keep": frame.keep.GetValue(),\
+        "tn": frame.target.GetValue(), "addition": frame.addition.GetValue()}
+        try:
+            members = group.parseMembers(self.members.GetValue(),\
+            self.selectedSystem, defaults)
+        except ValueError as e:
+            self.table.SetValue("")
+            self.summary.SetLabel(str(e))
+            return
+        if not worker.groupRunsInBackground(members):
+            self.rolled(self.rollAndTabulate(members))
+            return
+        self.rollButton.Enable(False)
+        self.table.SetValue("")
+        self.summary.SetLabel("Rolling...")
+        cost = worker.groupCost(members)
+        self.job = worker.BackgroundJob(lambda job: self.rollAndTabulate(\
+        members, lambda source: worker.WatchedSource(source, job, cost)),\
+        self.rolled, self.failed, wx.CallAfter).start()
+
+    # Roll the group and make its table.  Nothing in here may touch the GUI.
+    def rollAndTabulate(self, members, wrap=None):
+        result = self.frame.session.rollGroup(members, wrap)
+        return (result, result.table())
+
+    def rolled(self, rolled):
+        (result, table) = rolled
+        self.job = None
+        self.rollButton.Enable(True)
+        self.table.SetValue(table)
+        self.summary.SetLabel(result.summary().strip() + "  " +\
+        describeRoll(result).strip())
+
+    def failed(self, error):
+        self.job = None
+        self.rollButton.Enable(True)
+        self.summary.SetLabel(str(error))
+
+    # Give up on any roll still going when the dialog is closed.
+    def closing(self, event):
+        if self.job is not None:
+            self.job.cancel()
+        self.EndModal(wx.ID_CLOSE)
+
+
+# Which roll of which session a result was, and under which stream version, so
+# it can be replayed with session.replay().
+def describeRoll(result):
+    return "Session %d, roll %d (stream version %d).\n" % (result.seed,\
+    result.counter, result.streamVersion)
+
+
+# Main app class
+class Roller(wx.App):
+    def OnInit(self):
+        frame = MainFrame(None, -1, "RPG Dice Roller")
+        frame.Show(True)
+        self.SetTopWindow(frame)
+        return True
+
+
+# Run the GUI until the window is closed.
+def main():
+    app = Roller(0)
+    app.MainLoop()
+
+
+if __name__ == "__main__":
+    main()
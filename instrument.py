@@ -0,0 +1,149 @@
+# RPG Dice Roller - Instrumentation
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Timings and counters for the roll pipeline, for finding out where the time
+# goes when rolls get slow: whether it's huge pools, runaway explosions or
+# showing the results.  Each phase of a roll is timed (see PHASES), and rolls
+# are counted per System and per type along with the dice rolled and how far
+# explosions went.
+#
+# It's all off until enable() is called, and costs one check of "enabled" per
+# phase until then.  snapshot() gives the numbers so far as plain values, and
+# a profiler callback can be given to see every timing as it happens.
+
+import time
+
+
+# The phases of a roll that are timed:
+#   generate: rolling the initial dice.
+#   explode:  rolling explosions.
+#   score:    counting successes, keeping dice and comparing with the TN.
+#   parse:    compiling a Free Entry formula (including cache lookups).
+#   evaluate: rolling a compiled Free Entry formula.
+#   render:   turning a result into text (see render.py).
+#   display:  showing that text in the GUI.
+PHASES = ("generate", "explode", "score", "parse", "evaluate", "render",\
+"display")
+
+# Whether anything is being recorded.
+enabled = False
+
+# Called as profiler(phase, seconds, system) for every timing, if set.
+# "system" is the System involved, or None.
+profiler = None
+
+
+# Everything recorded since the last reset().
+class Stats:
+    # Constructor
+    def __init__(self):
+        # phase -> [count, total seconds, longest]
+        self.phases = dict([(phase, [0, 0.0, 0.0]) for phase in PHASES])
+        self.systems = dict()
+        self.types = dict()
+        self.dice = 0
+        self.largestPool = 0
+        self.explodingRolls = 0
+        self.explosionGenerations = 0
+        self.explodedDice = 0
+        self.maxExplosionDepth = 0
+
+
+stats = Stats()
+
+
+# Start recording, optionally passing every timing to a profiler callback.
+def enable(callback=None):
+    global enabled, profiler
+    enabled = True
+    profiler = callback
+
+
+# Stop recording.  What's been recorded so far is kept.
+def disable():
+    global enabled, profiler
+    enabled = False
+    profiler = None
+
+
+# Throw away everything recorded so far.
+def reset():
+    global stats
+    stats = Stats()
+
+
+# Start timing a phase.  Returns None if nothing's being recorded, so that
+# finish() can return straight away.
+def start():
+    if not enabled:
+        return None
+    return time.perf_counter()
+
+
+# Finish timing a phase started with start().
+def finish(phase, started, system=None):
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    timing = stats.phases[phase]
+    timing[0] = timing[0] + 1
+    timing[1] = timing[1] + elapsed
+    if elapsed > timing[2]:
+        timing[2] = elapsed
+    if profiler is not None:
+        profiler(phase, elapsed, system)
+
+
+# Count a roll of a System, of "quantity" initial dice (or None for Free
+# Entry, which counts its dice as it rolls them with countDice()).
+def countRoll(system, quantity):
+    if not enabled:
+        return
+    stats.systems[system.name] = stats.systems.get(system.name, 0) + 1
+    stats.types[system.type] = stats.types.get(system.type, 0) + 1
+    if quantity is not None:
+        countDice(quantity)
+
+
+# Count some dice rolled.
+def countDice(quantity):
+    if not enabled:
+        return
+    stats.dice = stats.dice + quantity
+    if quantity > stats.largestPool:
+        stats.largestPool = quantity
+
+
+# Count a roll's explosions: how many generations of new dice there were (the
+# length of the longest chain) and how many dice they added altogether.
+def countExplosions(generations, added):
+    if not enabled or generations == 0:
+        return
+    stats.explodingRolls = stats.explodingRolls + 1
+    stats.explosionGenerations = stats.explosionGenerations + generations
+    stats.explodedDice = stats.explodedDice + added
+    if generations > stats.maxExplosionDepth:
+        stats.maxExplosionDepth = generations
+
+
+# Everything recorded so far, as a dict of plain values (e.g. for JSON).
+def snapshot():
+    phases = dict()
+    for (phase, (count, seconds, longest)) in stats.phases.items():
+        phases[phase] = {"count": count, "seconds": seconds,\
+        "mean": seconds / count if count > 0 else None, "max": longest}
+    return {
+        "enabled": enabled,
+        "phases": phases,
+        "systems": dict(stats.systems),
+        "types": dict(stats.types),
+        "dice": stats.dice,
+        "largestPool": stats.largestPool,
+        "explosions": {
+            "rolls": stats.explodingRolls,
+            "generations": stats.explosionGenerations,
+            "dice": stats.explodedDice,
+            "maxDepth": stats.maxExplosionDepth,
+        },
+    }
@@ -0,0 +1,226 @@
+# RPG Dice Roller - Odds
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# The chances of success, botch and failure, and the expected result, for a
+# roll, as shown live in the GUI.  They're worked out by probability.py and
+# kept in a table on disk per System definition, so that once worked out
+# they're instant, even on the next launch.  The table for a System is keyed on
+# its whole definition, so changing a System (e.g. in a house rules file)
+# starts its table afresh and nothing else.
+#
+# precompute() fills the table for the commonly used ranges of each System a
+# bit at a time, saving as it goes, so that it can be run in the background
+# and pick up where it left off next time.
+
+import hashlib
+import json
+import os
+import threading
+
+import engine
+import probability
+
+
+# Where the table is kept.
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".rpgdiceroller-odds.json")
+
+# Bump this if the way odds are worked out changes, to throw old tables away.
+CACHE_VERSION = 1
+
+# Rolls that take more steps than this to work out exactly (see
+# probability.workEstimate()), a couple of seconds or so, take too long while
+# the user waits.
+MAX_WORK = 3000000
+
+# How many new entries precompute() works out between saves.
+SAVE_EVERY = 200
+
+
+# The odds of a roll.  "success", "botch" and "failure" are None if there's no
+# TN; "mean" is the expected total, or number of successes for Success-based
+# systems.
+class Odds:
+    # Constructor
+    def __init__(self, success, botch, failure, mean):
+        self.success = success
+        self.botch = botch
+        self.failure = failure
+        self.mean = mean
+
+    # The odds as a line of text for the GUI.
+    def describe(self, system):
+        if system.type == "Success-based":
+            expected = "expect %.1f successes" % self.mean
+        else:
+            expected = "expect a total of %.1f" % self.mean
+        if self.success is None:
+            return "Odds: %s." % expected
+        return "Odds: success %.1f%%, botch %.1f%%, failure %.1f%%; %s." %\
+        (100 * self.success, 100 * self.botch, 100 * self.failure, expected)
+
+
+# Work out the odds of a roll from scratch.
+def computeOdds(params):
+    distribution = probability.distributionFor(params)
+    return Odds(distribution.success, distribution.botch,\
+    distribution.failure, distribution.mean())
+
+
+# Whether the odds of a roll can be worked out (quickly enough).
+def hasOdds(params):
+    return params.system.type != "Free Entry" and\
+    probability.workEstimate(params.system, params.quantity, params.poly,\
+    params.keep) <= MAX_WORK
+
+
+# The key of a System's table: a digest of its whole definition.
+def definitionKey(system):
+    return hashlib.sha256(repr(system.definition()).encode("utf-8"))\
+    .hexdigest()[0:16]
+
+
+# The key of a roll within its System's table.
+def entryKey(params):
+    return "%d/%d/%s/%s/%d" % (params.quantity, params.poly, params.keep,\
+    params.tn, params.addition)
+
+
+# The table of odds, loaded from disk when first needed.  It's shared between
+# the GUI and the background precompute(), so everything goes through a lock.
+class OddsCache:
+    # Constructor
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = False
+        # definition key -> {"system": name, "odds": {entry key: [success,
+        # botch, failure, mean]}}
+        self.tables = dict()
+        # System name -> the definition key in use this time.
+        self.current = dict()
+        self.unsaved = 0
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            cacheFile = open(self.path)
+            try:
+                data = json.load(cacheFile)
+            finally:
+                cacheFile.close()
+        except (OSError, ValueError):
+            # A damaged table is just worked out again.
+            return
+        if isinstance(data, dict) and data.get("version") == CACHE_VERSION:
+            self.tables = data.get("tables", dict())
+
+    # The odds for a System's table, creating the table if need be.
+    def table(self, system):
+        key = definitionKey(system)
+        self.current[system.name] = key
+        if key not in self.tables:
+            self.tables[key] = {"system": system.name, "odds": dict()}
+        return self.tables[key]["odds"]
+
+    # The odds of a roll if they're already known, otherwise None.
+    def get(self, params):
+        with self.lock:
+            self.load()
+            entry = self.table(params.system).get(entryKey(params))
+        if entry is None:
+            return None
+        return Odds(*entry)
+
+    # The odds of a roll, working them out if they aren't already known.
+    def oddsFor(self, params):
+        odds = self.get(params)
+        if odds is None:
+            odds = computeOdds(params)
+            with self.lock:
+                self.table(params.system)[entryKey(params)] = [odds.success,\
+                odds.botch, odds.failure, odds.mean]
+                self.unsaved = self.unsaved + 1
+        return odds
+
+    # Write the table to disk, dropping tables for old definitions of the
+    # Systems in use.
+    def save(self):
+        with self.lock:
+            if not self.loaded or self.unsaved == 0:
+                return
+            for (key, table) in list(self.tables.items()):
+                name = table["system"]
+                if name in self.current and self.current[name] != key:
+                    del self.tables[key]
+            data = json.dumps({"version": CACHE_VERSION,\
+            "tables": self.tables})
+            self.unsaved = 0
+            # Write a new file and swap it in, so a crash can't leave half a
+            # table.
+            temporary = self.path + ".tmp"
+            cacheFile = open(temporary, "w")
+            try:
+                cacheFile.write(data)
+            finally:
+                cacheFile.close()
+            os.replace(temporary, self.path)
+
+
+# The rolls whose odds are worth working out in advance for a System: pools of
+# up to 20 dice against every TN for Success-based systems, up to 4 dice
+# against TNs up to 30 for Overall Target systems (d20 and the like), and up to
+# 10 dice with every keep against TNs in steps of 5 for Roll & Keep.  Values
+# the System fixes replace these ranges, as the GUI does.
+def commonParameters(system):
+    if system.type == "Free Entry":
+        return []
+    if system.type == "Success-based":
+        poly = system.fixPoly if system.fixPoly >= 0 else 10
+        ranges = [(q, None, tn) for q in range(1, 21)\
+        for tn in range(2, poly + 1)]
+    elif system.type == "Overall Target":
+        poly = system.fixPoly if system.fixPoly >= 0 else 20
+        ranges = [(q, None, tn) for q in range(1, 5) for tn in range(1, 31)]
+    else:
+        poly = system.fixPoly if system.fixPoly >= 0 else 10
+        ranges = [(q, keep, tn) for q in range(1, 11)\
+        for keep in range(1, q + 1) for tn in range(5, 55, 5)]
+
+    seen = set()
+    parameters = list()
+    for (quantity, keep, tn) in ranges:
+        try:
+            params = engine.RollParameters(system, quantity, poly, keep, tn,\
+            0)
+        except ValueError:
+            continue
+        key = entryKey(params)
+        if key not in seen and hasOdds(params):
+            seen.add(key)
+            parameters.append(params)
+    return parameters
+
+
+# Work out the odds of the common rolls of every System, skipping any already
+# known and saving as it goes.  If "job" is a worker.BackgroundJob, progress is
+# reported to it and cancelling it stops (after saving).
+def precompute(cache, systems, job=None):
+    parameters = list()
+    for system in systems:
+        parameters.extend(commonParameters(system))
+    try:
+        for (i, params) in enumerate(parameters):
+            if job is not None:
+                job.checkCancelled()
+                job.progress(float(i) / len(parameters))
+            cache.oddsFor(params)
+            if cache.unsaved >= SAVE_EVERY:
+                cache.save()
+    finally:
+        cache.save()
+    return len(parameters)
@@ -0,0 +1,349 @@
+# RPG Dice Roller - Probability engine
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Exact outcome distributions for every System type, worked out by dynamic
+# programming over the dice rather than by rolling them.  Results follow exactly
+# the same rules as engine.roll(), and are cached per configuration so that
+# asking "what are the odds?" again is free.
+
+import functools
+import math
+
+
+# Explosion chains can in theory go on forever.  We follow them until the
+# probability of going any further drops below this, and lump whatever's left
+# onto the last value considered.
+EPSILON = 1e-12
+
+# How many configurations to remember.
+CACHE_SIZE = 4096
+
+
+# The exact distribution of a roll.  "outcomes" maps each possible total
+# ("Overall Target", "Roll & Keep") or number of successes ("Success-based") to
+# its probability.  "success", "botch" and "failure" are the chances of the roll
+# as a whole succeeding, botching or failing, or None if there is no TN.
+class Distribution:
+    # Constructor
+    def __init__(self, outcomes, success=None, botch=None, failure=None):
+        self.outcomes = outcomes
+        self.success = success
+        self.botch = botch
+        self.failure = failure
+
+    # The expected total or number of successes.
+    def mean(self):
+        return sum([value * p for (value, p) in self.outcomes.items()])
+
+    # The chance of getting at least the given total or number of successes.
+    def atLeast(self, value):
+        return sum([p for (v, p) in self.outcomes.items() if v >= value])
+
+    # The chance of getting at most the given total or number of successes.
+    def atMost(self, value):
+        return sum([p for (v, p) in self.outcomes.items() if v <= value])
+
+
+# Work out the distribution for a set of engine.RollParameters.
+def distributionFor(params):
+    return distribution(params.system, params.quantity, params.poly,\
+    params.keep, params.tn, params.addition)
+
+
+# Roughly how many steps distribution() takes for a System with the given
+# quantity, poly and keep, for judging whether it's worth waiting for.  Each
+# die convolved in costs the number of states so far times the outcomes of a
+# die, and the states grow with every die; a step is around a microsecond.
+def workEstimate(system, quantity, poly, keep=None):
+    if system.type == "Success-based":
+        if system.maxExplodes == True:
+            chain = len(chainSuccesses(poly, poly, system.rollOverUnder))
+        else:
+            chain = 1
+        flags = 1
+        if system.minIsBotch == True:
+            flags = flags * 2
+        if system.maxIsSuccess == True:
+            flags = flags * 2
+        return (poly - 1 + chain) * (chain + 1) * flags * quantity * quantity\
+        // 2
+    values = len(dieValues(poly, system.maxExplodes == True))
+    if system.type == "Roll & Keep" and keep < quantity:
+        return keep * keep * keep * values * values // 4
+    return quantity * quantity * values * values // 2
+
+
+# Work out the distribution for a System with the given quantity, poly, keep,
+# TN and addition.  Fixed values are expected to have been applied already (as
+# engine.RollParameters does).
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def distribution(system, quantity, poly, keep=None, tn=None, addition=0):
+    if system.type == "Overall Target":
+        return overallTargetDistribution(system, quantity, poly, tn, addition)
+    if system.type == "Success-based":
+        return successBasedDistribution(system, quantity, poly, tn)
+    if system.type == "Roll & Keep":
+        return rollAndKeepDistribution(system, quantity, poly, keep, tn)
+    raise ValueError("Can't work out the odds for %s systems." % system.type)
+
+
+# The values a single die can end up with, as a list of (value, probability)
+# pairs in increasing order of value.  Exploding dice (Overall Target and Roll
+# & Keep style) add another roll each time they hit the maximum.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def dieValues(poly, explodes):
+    p = 1.0 / poly
+    if not explodes:
+        return tuple([(v, p) for v in range(1, poly + 1)])
+    values = list()
+    reach = 1.0
+    level = 0
+    while reach * p >= EPSILON:
+        for r in range(1, poly):
+            values.append((poly * level + r, reach * p))
+        reach = reach * p
+        level = level + 1
+    values.append((poly * level, reach))
+    return tuple(values)
+
+
+# The number of successes contributed by one extra die added by an explosion
+# (Success-based style), including any further dice it explodes into.  Returned
+# as a dict of successes to probability.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def chainSuccesses(poly, tn, overUnder):
+    p = 1.0 / poly
+    finished = dict()
+    pending = {0: 1.0}
+    while sum(pending.values()) >= EPSILON:
+        nextPending = dict()
+        for (successes, reach) in pending.items():
+            for w in range(1, poly + 1):
+                s = successes + isSuccess(w, tn, overUnder)
+                if w == poly:
+                    addTo(nextPending, s, reach * p)
+                else:
+                    addTo(finished, s, reach * p)
+        pending = nextPending
+    for (successes, reach) in pending.items():
+        addTo(finished, successes, reach)
+    return finished
+
+
+# Is a single die value a success against a per-die TN?
+def isSuccess(value, tn, overUnder):
+    if overUnder == "Over":
+        return 1 if value >= tn else 0
+    return 1 if value <= tn else 0
+
+
+# Add probability to a dict entry, creating it if required.
+def addTo(table, key, p):
+    table[key] = table.get(key, 0.0) + p
+
+
+# Convolve the state distribution of some dice with that of one more die.
+# "combine" takes a state and a die outcome and returns the new state.
+def convolve(states, dieOutcomes, combine):
+    newStates = dict()
+    for (state, p) in states.items():
+        for (outcome, q) in dieOutcomes:
+            addTo(newStates, combine(state, outcome), p * q)
+    return newStates
+
+
+# Compare a total with a TN in the same way as engine.compareWithTarget(),
+# returning the number of successes (0 or 1).
+def totalSucceeds(total, tn, overUnder):
+    if total == tn:
+        return 1
+    if total < tn and overUnder == "Under":
+        return 1
+    if total > tn and overUnder == "Over":
+        return 1
+    return 0
+
+
+# Sum distribution for "Overall Target" systems.  Alongside the sum we track
+# whether any of the initial dice rolled a minimum (for botches) or a maximum
+# (for maxIsSuccess), but only where the System cares.
+def overallTargetDistribution(system, quantity, poly, tn, addition):
+    states = overallStates(quantity, poly, system.maxExplodes == True,\
+    system.minIsBotch == True, system.maxIsSuccess == True)
+    outcomes = dict()
+    success = 0.0
+    botch = 0.0
+    for ((total, anyMin, anyMax), p) in states.items():
+        total = total + addition
+        addTo(outcomes, total, p)
+        if tn is None:
+            continue
+        if totalSucceeds(total, tn, system.rollOverUnder) or anyMax:
+            success = success + p
+        elif anyMin:
+            botch = botch + p
+    if tn is None:
+        return Distribution(outcomes)
+    return Distribution(outcomes, success, botch, 1.0 - success - botch)
+
+
+# The distribution of (sum, any minimums, any maximums) for an Overall Target
+# roll, which doesn't depend on the TN or addition, so is cached separately.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def overallStates(quantity, poly, explodes, trackMin, trackMax):
+    dieOutcomes = list()
+    for (value, p) in dieValues(poly, explodes):
+        isMin = trackMin and value == 1
+        isMax = trackMax and value >= poly
+        dieOutcomes.append(((value, isMin, isMax), p))
+
+    states = {(0, False, False): 1.0}
+    for die in range(quantity):
+        states = convolve(states, dieOutcomes, lambda s, o :\
+        (s[0] + o[0], s[1] or o[1], s[2] or o[2]))
+    return states
+
+
+# Success-count distribution for "Success-based" systems.  The state for a
+# number of dice is (net successes, any minimums, no raw successes yet, maximums
+# while there were no raw successes), which is just enough to apply
+# maxIsSuccess, maxIsDouble, minIsMinusSuccess and botches exactly as the engine
+# does.  The last two parts are only tracked for maxIsSuccess systems.
+def successBasedDistribution(system, quantity, poly, tn):
+    overUnder = system.rollOverUnder
+    trackMin = system.minIsBotch == True
+    trackZero = system.maxIsSuccess == True
+    p = 1.0 / poly
+
+    dieOutcomes = list()
+    for value in range(1, poly + 1):
+        isMin = value == 1
+        isMax = value == poly
+        adjustment = 0
+        if isMax and system.maxIsDouble == True:
+            adjustment = adjustment + 1
+        if isMin and system.minIsMinusSuccess == True:
+            adjustment = adjustment - 1
+        raw = isSuccess(value, tn, overUnder)
+        if isMax and system.maxExplodes == True:
+            chain = chainSuccesses(poly, tn, overUnder).items()
+        else:
+            chain = [(0, 1.0)]
+        for (extra, q) in chain:
+            dieOutcomes.append(((raw + extra, adjustment, trackMin and isMin,\
+            isMax), p * q))
+
+    def combine(state, outcome):
+        (net, anyMin, zeroRaw, maxes) = state
+        (raw, adjustment, isMin, isMax) = outcome
+        net = net + raw + adjustment
+        anyMin = anyMin or isMin
+        if not trackZero or not zeroRaw or raw > 0:
+            return (net, anyMin, False, 0)
+        return (net, anyMin, True, maxes + (1 if isMax else 0))
+
+    states = {(0, False, trackZero, 0): 1.0}
+    for die in range(quantity):
+        states = convolve(states, dieOutcomes, combine)
+
+    outcomes = dict()
+    success = 0.0
+    botch = 0.0
+    for ((net, anyMin, zeroRaw, maxes), q) in states.items():
+        successes = net
+        if zeroRaw and maxes > 0:
+            successes = net + maxes
+        addTo(outcomes, successes, q)
+        if successes > 0:
+            success = success + q
+        elif anyMin:
+            botch = botch + q
+    return Distribution(outcomes, success, botch, 1.0 - success - botch)
+
+
+# Kept-sum distribution for "Roll & Keep" systems.  Rather than enumerating
+# every roll, we go through the possible die values in the order they'd be kept
+# (highest first unless rolling "Under") and work out how many of the remaining
+# dice land on each one, stopping as soon as enough dice have been kept.
+def rollAndKeepDistribution(system, quantity, poly, keep, tn):
+    totals = keptTotals(quantity, poly, keep, system.maxExplodes == True,\
+    system.rollOverUnder == "Under")
+    return keptTotalsDistribution(system, dict(totals), tn)
+
+
+# The distribution of kept totals, which doesn't depend on the TN (or on
+# anything else about the System but these), so is cached separately for
+# working out the odds against lots of TNs.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def keptTotals(quantity, poly, keep, explodes, keepLowest):
+    values = list(dieValues(poly, explodes))
+
+    # Keeping everything is just a sum.
+    if keep >= quantity:
+        totals = {0: 1.0}
+        for die in range(quantity):
+            totals = convolve(totals, values, lambda s, o : s + o)
+        return totals
+
+    if not keepLowest:
+        values.reverse()
+
+    # Probability mass of each value and everything after it in keep order.
+    remainingMass = list()
+    mass = 0.0
+    for (value, p) in reversed(values):
+        mass = mass + p
+        remainingMass.append(mass)
+    remainingMass.reverse()
+
+    totals = dict()
+    states = {(0, 0): 1.0}
+    for (i, (value, p)) in enumerate(values):
+        if len(states) == 0:
+            break
+        last = (i == len(values) - 1)
+        r = 1.0 if last else min(1.0, p / remainingMass[i])
+        newStates = dict()
+        for ((assigned, total), q) in states.items():
+            left = quantity - assigned
+            needed = keep - assigned
+
+            # Fewer than "needed" dice on this value leaves us still looking.
+            unfinished = 0.0
+            for count in range(min(needed, left + 1)):
+                chance = binomial(left, count, r)
+                unfinished = unfinished + chance
+                if chance > 0.0:
+                    addTo(newStates, (assigned + count, total + count * value),\
+                    q * chance)
+
+            # Any more and we've kept all we need, whatever happens next.
+            if needed <= left:
+                addTo(totals, total + needed * value,\
+                q * max(0.0, 1.0 - unfinished))
+        states = newStates
+
+    return totals
+
+
+# Turn a distribution of kept totals into a Distribution with the chance of
+# beating the TN.  Roll & Keep systems never botch.
+def keptTotalsDistribution(system, totals, tn):
+    if tn is None:
+        return Distribution(totals)
+    success = sum([q for (total, q) in totals.items()\
+    if totalSucceeds(total, tn, system.rollOverUnder)])
+    return Distribution(totals, success, 0.0, 1.0 - success)
+
+
+# The chance of exactly "count" successes out of "n" tries with chance "p".
+def binomial(n, count, p):
+    if p >= 1.0:
+        return 1.0 if count == n else 0.0
+    if p <= 0.0:
+        return 1.0 if count == 0 else 0.0
+    logChance = math.lgamma(n + 1) - math.lgamma(count + 1) -\
+    math.lgamma(n - count + 1) + count * math.log(p) +\
+    (n - count) * math.log1p(-p)
+    return math.exp(logChance)
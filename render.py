@@ -0,0 +1,161 @@
+# RPG Dice Roller - Result rendering
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Turns a RollResult into the text shown to the user.  Small pools are printed
+# in full, as they always have been; pools too big to print within the size
+# budget are summarised as a count of each face plus the lowest and highest
+# values, so that a 50,000-die pool doesn't produce a huge string.  The full
+# text is still available from the Rendering on request.
+
+import collections
+
+import instrument
+
+
+# Roughly how many characters of individual rolls to print before switching to
+# a summary.
+DEFAULT_BUDGET = 4000
+
+# How many distinct values to list in a summary, and how many of the lowest and
+# highest values to show.
+MAX_FACES = 50
+EXTREMES = 5
+
+
+# The rendered text of a roll.  If the dice had to be summarised, "summarised"
+# is True and detail() gives the full text.
+class Rendering:
+    # Constructor
+    def __init__(self, result, text, summarised):
+        self.result = result
+        self.text = text
+        self.summarised = summarised
+
+    # The full text with every die listed.  This is only built when asked for.
+    def detail(self):
+        if not self.summarised:
+            return self.text
+        return renderResult(self.result, None).text
+
+
+# Render a RollResult as text, keeping the dice within the given budget of
+# characters (or printing them all if the budget is None).
+def renderResult(result, budget=DEFAULT_BUDGET):
+    started = instrument.start()
+    rendering = buildRendering(result, budget)
+    instrument.finish("render", started, result.system)
+    return rendering
+
+
+# Do the actual work of renderResult().
+def buildRendering(result, budget):
+    system = result.system
+    output = list()
+    summarised = False
+
+    # Free Entry mode shows each roll in the formula separately.
+    if system.type == "Free Entry":
+        output.append("Individual rolls: ")
+        termBudget = budget
+        if budget is not None and len(result.terms) > 0:
+            termBudget = max(1, budget // len(result.terms))
+        for (roll, dice) in result.terms:
+            (text, wasSummarised) = describeDice(dice, termBudget)
+            summarised = summarised or wasSummarised
+            output.append(" " + roll + ":" + text)
+        output.append("\n")
+        output.append("Total: " + str(result.total) + "\n")
+        return Rendering(result, "".join(output), summarised)
+
+    # Display individual rolls
+    (text, summarised) = describeDice(result.dice, budget, result.counts)
+    output.append("Individual rolls: " + text + "\n")
+
+    if system.type == "Success-based":
+        if result.successes > 0:
+            output.append("%d successes!\n" % result.successes)
+        elif result.botches > 0:
+            output.append("Botch.\n")
+        else:
+            output.append("No successes.\n")
+        return Rendering(result, "".join(output), summarised)
+
+    # Display chosen rolls
+    if system.type == "Roll & Keep":
+        (text, keptSummarised) = describeDice(result.kept, budget)
+        summarised = summarised or keptSummarised
+        output.append("Chosen rolls: " + text + "\n")
+
+    output.append("Total: " + str(result.total) + "\n")
+
+    # If there was a target to beat, say how we did against it.
+    if result.comparison == "less":
+        output.append("Rolled less than target.\n")
+    if result.comparison == "more":
+        output.append("Rolled more than target.\n")
+    if result.comparison == "even":
+        output.append("Rolled even with target.\n")
+    if result.outcome == "Success":
+        output.append("Success!\n")
+    if result.outcome == "Botch":
+        output.append("Botch.\n")
+    if result.outcome == "Failure":
+        output.append("Failure.\n")
+    return Rendering(result, "".join(output), summarised)
+
+
+# Describe a list of dice, in full if it fits in the budget and as a summary
+# otherwise.  Returns the text and whether it was summarised.  Huge pools that
+# were rolled as counts (a dict of value -> number of dice) rather than
+# individual dice can only be summarised, listing MAX_FACES values like any
+# other summary unless there's no budget, and those that were only summed
+# can't even be that.
+def describeDice(dice, budget, counts=None):
+    if isinstance(dice, dict):
+        (dice, counts) = (None, dice)
+    if dice is None:
+        if counts is None:
+            return ("[too many dice to count]", False)
+        if budget is None:
+            return (summariseCounts(counts, None), False)
+        return (summariseCounts(counts, MAX_FACES), len(counts) > MAX_FACES)
+    if budget is None or len(dice) == 0:
+        return (str(dice), False)
+    # Each die takes its digits plus ", ".
+    if len(dice) * (len(str(max(dice))) + 2) <= budget:
+        return (str(dice), False)
+    return (summariseDice(dice), True)
+
+
+# Summarise a list of dice as "[N dice, sum S] face:count ... lowest ...
+# highest ...".
+def summariseDice(dice):
+    return summariseCounts(collections.Counter(dice), MAX_FACES)
+
+
+# Summarise a dict of value -> number of dice in the same way, listing up to
+# maxFaces values (or all of them if that's None).
+def summariseCounts(counts, maxFaces):
+    faces = sorted(counts)
+    quantity = sum(counts.values())
+    total = sum([face * counts[face] for face in faces])
+    output = ["[%d dice, sum %d]" % (quantity, total)]
+    shown = faces if maxFaces is None else faces[0:maxFaces]
+    for face in shown:
+        output.append(" %d:%d" % (face, counts[face]))
+    if len(faces) > len(shown):
+        output.append(" ... and %d more values" % (len(faces) - len(shown)))
+    output.append("; lowest " + str(extremes(counts, faces)))
+    output.append("; highest " + str(extremes(counts, reversed(faces))))
+    return "".join(output)
+
+
+# The first few dice, going through the values in the given order.
+def extremes(counts, faces):
+    values = list()
+    for face in faces:
+        values.extend([face] * min(counts[face], EXTREMES - len(values)))
+        if len(values) >= EXTREMES:
+            break
+    return values
@@ -0,0 +1,314 @@
+# RPG Dice Roller - Random number generation
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# A buffered source of dice rolls, used by every roll path instead of one
+# random.randint() call per die.  Random bytes are fetched in large blocks and
+# turned into die values for each poly in bulk, using rejection sampling so that
+# polys which don't divide evenly into the range aren't biased.
+#
+# There are three backends:
+#   "fast":   Python's Mersenne Twister, seeded from the OS.
+#   "seeded": Python's Mersenne Twister with a given seed, for reproducible
+#             rolls.
+#   "os":     The operating system's entropy source (os.urandom).
+# The backend can be chosen per session with useBackend(), or sources can be
+# created with createRNG() and passed to the engine directly.
+
+import math
+import os
+import random
+
+
+BACKENDS = ["fast", "seeded", "os"]
+
+# The most random bytes to fetch at once for dice of up to 255 sides, by
+# default.  Bigger dice (and floats) fetch enough for a sixteenth as many
+# values at a time instead.
+BLOCK_SIZE = 65536
+
+# The first block for each poly holds enough for the first draw, and at least
+# this many values; each block after that is twice the size of the one before,
+# up to the block size.  So a source that only rolls a few dice doesn't pay
+# for a full block of every poly it sees.
+FIRST_BLOCK = 16
+
+# Dice with more sides than this are rolled one at a time rather than in
+# blocks.
+MAX_BLOCK_POLY = 1 << 32
+
+# faceCounts() rolls pools of up to this many dice per face individually.
+SMALL_POOL = 8
+
+# Pools of at least this many dice are rolled as counts or sums rather than as
+# individual dice, by whichever roll paths can (see sumDice() and
+# faceCounts()).
+COUNTED_POOL_THRESHOLD = 1000
+
+# Dice with more sides than this have their sums approximated by sumDice().
+MAX_COUNTED_POLY = 1000
+
+# Buffers are kept per poly; if somebody rolls lots of odd-sized dice we throw
+# them all away rather than growing forever.
+MAX_BUFFERS = 64
+
+
+# A buffered source of die rolls, drawing its randomness from "randomBytes", a
+# function that returns the given number of random bytes.
+class BufferedRNG:
+    # Constructor
+    def __init__(self, randomBytes, backend="fast", seed=None,\
+    blockSize=BLOCK_SIZE):
+        self.randomBytes = randomBytes
+        self.backend = backend
+        self.seed = seed
+        # The number of this roll within its session, for sources made by
+        # session.Session, and the version of session.py's stream contract
+        # for seeded sources that follow it.
+        self.counter = None
+        self.streamVersion = None
+        self.blockSize = blockSize
+        self.wideBlockSize = max(16, blockSize // 16)
+        # poly -> [values, position of the next unused value]
+        self.buffers = dict()
+        # poly -> the number of values asked for in its last block
+        self.blockSizes = dict()
+        self.floats = list()
+        self.floatPosition = 0
+
+    # Roll a single die.
+    def randint(self, poly):
+        if poly > MAX_BLOCK_POLY:
+            return self.below(poly) + 1
+        buffer = self.buffers.get(poly)
+        if buffer is None or buffer[1] >= len(buffer[0]):
+            buffer = self.refill(poly, 1)
+        value = buffer[0][buffer[1]]
+        buffer[1] = buffer[1] + 1
+        return value
+
+    # Roll a batch of dice, returning a list of their values.
+    def draw(self, poly, count):
+        if poly > MAX_BLOCK_POLY:
+            return [self.below(poly) + 1 for i in range(count)]
+        dice = list()
+        buffer = self.buffers.get(poly)
+        while count > 0:
+            if buffer is None or buffer[1] >= len(buffer[0]):
+                buffer = self.refill(poly, count)
+            (values, position) = buffer
+            taken = min(count, len(values) - position)
+            dice.extend(values[position:position + taken])
+            buffer[1] = position + taken
+            count = count - taken
+        return dice
+
+    # A uniform float in [0, 1), built from 53 buffered random bits.
+    def random(self):
+        if self.floatPosition >= len(self.floats):
+            raw = memoryview(self.randomBytes(8 * self.wideBlockSize)).cast("Q")
+            self.floats = [(v >> 11) * (1.0 / 9007199254740992.0)\
+            for v in raw]
+            self.floatPosition = 0
+        value = self.floats[self.floatPosition]
+        self.floatPosition = self.floatPosition + 1
+        return value
+
+    # The number of successes in n tries that each succeed with chance p,
+    # drawn exactly in roughly constant time however big n is.  This uses
+    # waiting times between successes when few are expected, and Hormann's
+    # BTRS transformed rejection method otherwise.
+    def binomial(self, n, p):
+        if n <= 0 or p <= 0.0:
+            return 0
+        if p >= 1.0:
+            return n
+        if p > 0.5:
+            return n - self.binomial(n, 1.0 - p)
+        if n * p < 10.0:
+            x = 0
+            y = 0
+            c = math.log(1.0 - p)
+            while True:
+                y = y + math.floor(math.log(1.0 - self.random()) / c) + 1
+                if y > n:
+                    return x
+                x = x + 1
+        spq = math.sqrt(n * p * (1.0 - p))
+        b = 1.15 + 2.53 * spq
+        a = -0.0873 + 0.0248 * b + 0.01 * p
+        c = n * p + 0.5
+        vr = 0.92 - 4.2 / b
+        alpha = (2.83 + 5.1 / b) * spq
+        lpq = math.log(p / (1.0 - p))
+        m = math.floor((n + 1) * p)
+        h = math.lgamma(m + 1) + math.lgamma(n - m + 1)
+        while True:
+            u = self.random() - 0.5
+            v = self.random()
+            us = 0.5 - abs(u)
+            k = math.floor((2.0 * a / us + b) * u + c)
+            if k < 0 or k > n:
+                continue
+            if us >= 0.07 and v <= vr:
+                return k
+            v = math.log(v * alpha / (a / (us * us) + b))
+            if v <= h - math.lgamma(k + 1) - math.lgamma(n - k + 1) +\
+            (k - m) * lpq:
+                return k
+
+    # Roll "count" dice and return how many came up on each face, as a list
+    # indexed by face - 1.  Small pools are just rolled; big ones are drawn
+    # from the multinomial distribution one face at a time, so the cost
+    # depends on poly rather than on the number of dice.
+    def faceCounts(self, poly, count):
+        counts = [0] * poly
+        if count <= SMALL_POOL * poly:
+            for value in self.draw(poly, count):
+                counts[value - 1] = counts[value - 1] + 1
+            return counts
+        remaining = count
+        for face in range(poly - 1):
+            counts[face] = self.binomial(remaining, 1.0 / (poly - face))
+            remaining = remaining - counts[face]
+        counts[poly - 1] = remaining
+        return counts
+
+    # A normally distributed float with mean 0 and standard deviation 1, by
+    # the Box-Muller method.
+    def gauss(self):
+        u = 1.0 - self.random()
+        return math.sqrt(-2.0 * math.log(u)) *\
+        math.cos(2.0 * math.pi * self.random())
+
+    # Roll "count" dice and return (sum, minimums, maximums, counts), without
+    # rolling them one at a time.  For dice of up to MAX_COUNTED_POLY sides
+    # the sum is exact, made from faceCounts(), and "counts" is the list of
+    # dice per face.  Bigger dice would make that list too long, so "counts"
+    # is None.  Fewer than COUNTED_POOL_THRESHOLD of them are just rolled and
+    # summed; for more, the numbers of minimums and maximums are drawn exactly
+    # but the rest of the sum comes from the normal approximation.  By the
+    # Berry-Esseen theorem the distribution of that sum is then within
+    # 0.62/sqrt(number of dice) of the true one; under 0.02 for the smallest
+    # pools that get approximated.
+    def sumDice(self, poly, count):
+        if poly <= MAX_COUNTED_POLY:
+            counts = self.faceCounts(poly, count)
+            total = sum([(face + 1) * n for (face, n) in enumerate(counts)])
+            return (total, counts[0], counts[poly - 1], counts)
+        if count < COUNTED_POOL_THRESHOLD:
+            dice = self.draw(poly, count)
+            return (sum(dice), dice.count(1), dice.count(poly), None)
+        minimums = self.binomial(count, 1.0 / poly)
+        maximums = self.binomial(count - minimums, 1.0 / (poly - 1))
+        middle = count - minimums - maximums
+        mean = middle * (poly + 1) / 2.0
+        spread = math.sqrt(middle * ((poly - 2) ** 2 - 1) / 12.0)
+        total = int(round(mean + spread * self.gauss()))
+        total = max(middle * 2, min(middle * (poly - 1), total))
+        return (total + minimums + maximums * poly, minimums, maximums, None)
+
+    # Replace the buffer for a poly with a fresh block of values, with room
+    # for at least "wanted" of them if the block size allows (see
+    # FIRST_BLOCK).  Sizes are kept to a multiple of four bytes, so that a
+    # poly's values don't depend on how its blocks were split up.
+    def refill(self, poly, wanted):
+        if poly not in self.buffers and len(self.buffers) >= MAX_BUFFERS:
+            self.buffers.clear()
+            self.blockSizes.clear()
+        size = max(wanted, 2 * self.blockSizes.get(poly, FIRST_BLOCK // 2))
+        limit = self.blockSize if poly <= 255 else self.wideBlockSize
+        size = min(limit, (size + 3) // 4 * 4)
+        self.blockSizes[poly] = size
+        buffer = [self.block(poly, size), 0]
+        self.buffers[poly] = buffer
+        return buffer
+
+    # A block of up to "size" unbiased die values for a poly of up to
+    # MAX_BLOCK_POLY.  Each value is made from one, two or four random bytes
+    # depending on the size of the die, and any bytes that would make a value
+    # from the uneven top end of the range are thrown away.
+    def block(self, poly, size):
+        if poly < 1:
+            raise ValueError("Dice must have at least one side.")
+        if poly <= 255:
+            (table, rejected) = byteTables(poly)
+            values = b""
+            while len(values) == 0:
+                values = self.randomBytes(size).translate(table, rejected)
+            return values
+        for (format, width) in (("H", 2), ("I", 4)):
+            span = 1 << (8 * width)
+            if poly <= span:
+                limit = span - span % poly
+                values = list()
+                while len(values) == 0:
+                    raw = memoryview(self.randomBytes(size * width))
+                    values = [v % poly + 1 for v in raw.cast(format)\
+                    if v < limit]
+                return values
+        raise ValueError("Dice with more than %d sides have no blocks." %\
+        MAX_BLOCK_POLY)
+
+    # A uniform integer in [0, n) for n too big for the block methods.
+    def below(self, n):
+        width = (n.bit_length() + 7) // 8
+        extra = 8 * width - n.bit_length()
+        while True:
+            value = int.from_bytes(self.randomBytes(width), "little") >> extra
+            if value < n:
+                return value
+
+
+# The translation table for turning random bytes into die values for a poly of
+# up to 255, and the bytes to delete because they'd bias the result.
+byteTableCache = dict()
+def byteTables(poly):
+    if poly not in byteTableCache:
+        limit = 256 - 256 % poly
+        table = bytes([b % poly + 1 if b < limit else 0 for b in range(256)])
+        byteTableCache[poly] = (table, bytes(range(limit, 256)))
+    return byteTableCache[poly]
+
+
+# Create a new source of die rolls using one of the BACKENDS.  The "seeded"
+# backend uses the given seed, or picks one (available as the source's "seed")
+# if there isn't one.  Note that the values a seeded source gives depend on
+# its block size as well as its seed.
+def createRNG(backend="fast", seed=None, blockSize=BLOCK_SIZE):
+    if backend == "fast":
+        return BufferedRNG(random.Random().randbytes, backend, None,\
+        blockSize)
+    if backend == "seeded":
+        if seed is None:
+            seed = random.getrandbits(64)
+        return BufferedRNG(random.Random(seed).randbytes, backend, seed,\
+        blockSize)
+    if backend == "os":
+        return BufferedRNG(os.urandom, backend, None, blockSize)
+    raise ValueError("Unknown random number backend %s." % backend)
+
+
+# The source used by rolls that aren't given one explicitly.
+current = None
+
+
+# Get the current session's source of die rolls, creating a "fast" one if
+# there isn't one yet.
+def getRNG():
+    global current
+    if current is None:
+        current = createRNG()
+    return current
+
+
+# Set the current session's source of die rolls.
+def setRNG(source):
+    global current
+    current = source
+
+
+# Switch the current session to a new source using one of the BACKENDS.
+def useBackend(backend, seed=None):
+    setRNG(createRNG(backend, seed))
+    return current
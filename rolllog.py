@@ -0,0 +1,297 @@
+# RPG Dice Roller - Roll log
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# An append-only binary history of rolls, for settling arguments after the
+# fact.  Every roll is one fixed-size record holding when it happened, the
+# session, roll counter and seed it came from, the System and inputs, a digest
+# of the dice and the result.  Each record also holds a hash chained from the
+# one before, so editing, removing or reordering records is detectable with
+# verify().
+#
+# Records are written through a buffer, and read back through a memory-mapped
+# reader that can filter and aggregate millions of records without loading
+# them all.
+
+import hashlib
+import mmap
+import os
+import random
+import struct
+import time
+
+
+# The file starts with this, followed by the record size.
+MAGIC = b"RPGLOG01"
+HEADER = struct.Struct("<8sQ")
+
+# timestamp, session, counter, seed, system id, input digest, quantity, poly,
+# keep, tn, addition, total, successes, botches, outcome, flags, stream
+# version (see session.py; 0 if none), dice digest, chain.
+RECORD = struct.Struct("<dQQQQQqqqqqqqqBBH4x16s16s")
+
+# Stands in for a missing number (e.g. no TN, or no total).
+NONE = -(1 << 63)
+
+# The range of numbers that can be stored.  Anything outside it (a Free Entry
+# total such as 9^20, say) is stored as the nearest end of the range, and the
+# record flagged as CLAMPED.
+SMALLEST = NONE + 1
+LARGEST = (1 << 63) - 1
+
+# Flags.
+CLAMPED = 1
+
+OUTCOMES = [None, "Success", "Failure", "Botch"]
+
+# How much to buffer before writing to disk.
+BUFFER_SIZE = 1 << 16
+
+
+# One record read back from a log.  Missing numbers are None, and "clamped"
+# says whether any numbers were too big to store exactly.  "streamVersion" is
+# None for rolls that weren't seeded.
+class LogRecord:
+    # Constructor
+    def __init__(self, fields):
+        (self.timestamp, self.session, self.counter, self.seed,\
+        self.systemId, self.inputDigest, self.quantity, self.poly, self.keep,\
+        self.tn, self.addition, self.total, self.successes, self.botches,\
+        outcome, flags, streamVersion, self.diceDigest, self.chain) =\
+        [None if v == NONE else v for v in fields]
+        self.outcome = OUTCOMES[outcome]
+        self.clamped = (flags & CLAMPED) != 0
+        self.streamVersion = streamVersion if streamVersion > 0 else None
+
+
+# An 8-byte id for a name (or anything else), for fixed-size storage.
+def digest64(value):
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    return struct.unpack("<Q", hashlib.sha256(data).digest()[0:8])[0]
+
+
+# The id stored for a System's name.
+def systemId(name):
+    return digest64(name)
+
+
+# A 16-byte digest of the dice (or counts) of a result.
+def diceDigest(result):
+    if result.dice is not None:
+        data = repr(result.dice)
+    elif result.counts is not None:
+        data = repr(sorted(result.counts.items()))
+    else:
+        data = repr(result.terms)
+    if result.kept is not None:
+        data = data + repr(result.kept)
+    return hashlib.sha256(data.encode("utf-8")).digest()[0:16]
+
+
+# Chain a record's contents onto the previous record's chain hash.
+def chainHash(previous, body):
+    return hashlib.sha256(previous + body).digest()[0:16]
+
+
+# Store an optional number.
+def orNone(value):
+    return NONE if value is None else value
+
+
+# Bring numbers into the range that can be stored, returning them and whether
+# any had to be changed.
+def clampNumbers(numbers):
+    clamped = [value if value == NONE else max(SMALLEST, min(LARGEST, value))\
+    for value in numbers]
+    return (clamped, clamped != numbers)
+
+
+# Appends rolls to a log file.  Each writer has a session id (random if not
+# given) and numbers its rolls from zero, unless told otherwise.
+class RollLog:
+    # Constructor
+    def __init__(self, path, session=None):
+        self.path = path
+        if session is None:
+            session = random.getrandbits(64)
+        self.session = session
+        self.counter = 0
+        self.previous = b"\0" * 16
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.previous = lastChain(path)
+            self.file = open(path, "ab", BUFFER_SIZE)
+        else:
+            self.file = open(path, "ab", BUFFER_SIZE)
+            self.file.write(HEADER.pack(MAGIC, RECORD.size))
+
+    # Record a roll made with the given parameters and result.  "seed" is the
+    # seed of the source of rolls used, if any, "counter" the roll's number
+    # within the session (by default, one more than the last) and
+    # "streamVersion" the version of the seeded stream it drew from.
+    def append(self, params, result, seed=None, counter=None,\
+    timestamp=None, streamVersion=None):
+        if counter is None:
+            counter = self.counter
+        self.counter = counter + 1
+        if timestamp is None:
+            timestamp = time.time()
+        if seed is None:
+            seed = 0
+        elif not isinstance(seed, int) or seed < 0 or seed >= (1 << 64):
+            seed = digest64(seed)
+        system = params.system
+        if system.type == "Free Entry":
+            inputDigest = digest64(params.compiled.text)
+            numbers = [NONE] * 5
+        else:
+            inputDigest = 0
+            numbers = [params.quantity, params.poly, orNone(params.keep),\
+            orNone(params.tn), params.addition]
+        (numbers, clamped) = clampNumbers(numbers + [orNone(result.total),\
+        result.successes, result.botches])
+        fields = [timestamp, self.session, counter, seed, systemId(system.name),\
+        inputDigest] + numbers + [OUTCOMES.index(result.outcome),\
+        CLAMPED if clamped else 0, streamVersion or 0, diceDigest(result)]
+        body = RECORD.pack(*(fields + [b"\0" * 16]))
+        self.previous = chainHash(self.previous, body[0:-16])
+        self.file.write(body[0:-16] + self.previous)
+
+    # Write anything buffered to disk.
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# The chain hash of the last record in an existing log.
+def lastChain(path):
+    logFile = open(path, "rb")
+    try:
+        checkHeader(logFile.read(HEADER.size))
+        size = os.path.getsize(path) - HEADER.size
+        if size % RECORD.size != 0:
+            raise ValueError("%s ends with a partial record." % path)
+        if size == 0:
+            return b"\0" * 16
+        logFile.seek(-16, os.SEEK_END)
+        return logFile.read(16)
+    finally:
+        logFile.close()
+
+
+# Make sure a log starts with the right header.
+def checkHeader(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Not a roll log.")
+    (magic, recordSize) = HEADER.unpack(data[0:HEADER.size])
+    if magic != MAGIC or recordSize != RECORD.size:
+        raise ValueError("Not a roll log, or from a different version.")
+
+
+# Reads a roll log through a memory map, so only the records looked at are
+# read from disk.
+class RollLogReader:
+    # Constructor
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.path.getsize(path)
+        checkHeader(self.file.read(HEADER.size))
+        self.count = (size - HEADER.size) // RECORD.size
+        if self.count > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)[HEADER.size:HEADER.size +\
+            self.count * RECORD.size]
+        else:
+            self.map = None
+            self.view = memoryview(b"")
+
+    def __len__(self):
+        return self.count
+
+    # The raw fields of record i.
+    def fields(self, i):
+        return RECORD.unpack_from(self.view, i * RECORD.size)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i = i + self.count
+        if i < 0 or i >= self.count:
+            raise IndexError("No record %d." % i)
+        return LogRecord(self.fields(i))
+
+    # The index of the first record at or after a time.  Records are written
+    # in time order, so this is a binary search.
+    def firstAtOrAfter(self, timestamp):
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.fields(middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Iterate over the raw fields of the records matching the filters.  Time
+    # filters are from "since" (inclusive) to "until" (exclusive).
+    def matchingFields(self, session=None, system=None, since=None,\
+    until=None):
+        start = 0 if since is None else self.firstAtOrAfter(since)
+        end = self.count if until is None else self.firstAtOrAfter(until)
+        wantedSystem = None if system is None else systemId(system)
+        view = self.view[start * RECORD.size:end * RECORD.size]
+        for fields in RECORD.iter_unpack(view):
+            if session is not None and fields[1] != session:
+                continue
+            if wantedSystem is not None and fields[4] != wantedSystem:
+                continue
+            yield fields
+
+    # Iterate over the LogRecords matching the filters.
+    def records(self, session=None, system=None, since=None, until=None):
+        for fields in self.matchingFields(session, system, since, until):
+            yield LogRecord(fields)
+
+    # Aggregate statistics over the records matching the filters, streamed
+    # rather than loaded.  Clamped totals are left out of the mean.
+    def stats(self, session=None, system=None, since=None, until=None):
+        count = 0
+        totals = 0
+        totalled = 0
+        successes = 0
+        outcomes = {"Success": 0, "Failure": 0, "Botch": 0}
+        for fields in self.matchingFields(session, system, since, until):
+            count = count + 1
+            if fields[11] != NONE and not fields[15] & CLAMPED:
+                totals = totals + fields[11]
+                totalled = totalled + 1
+            successes = successes + fields[12]
+            outcome = OUTCOMES[fields[14]]
+            if outcome is not None:
+                outcomes[outcome] = outcomes[outcome] + 1
+        return {
+            "rolls": count,
+            "meanTotal": float(totals) / totalled if totalled > 0 else None,
+            "meanSuccesses": float(successes) / count if count > 0 else None,
+            "outcomes": outcomes,
+        }
+
+    # Check the hash chain, returning the index of the first record that
+    # doesn't match (i.e. has been tampered with), or None if all is well.
+    def verify(self):
+        previous = b"\0" * 16
+        for i in range(self.count):
+            record = self.view[i * RECORD.size:(i + 1) * RECORD.size]
+            expected = chainHash(previous, bytes(record[0:-16]))
+            if expected != bytes(record[-16:]):
+                return i
+            previous = expected
+        return None
+
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
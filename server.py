@@ -0,0 +1,192 @@
+# RPG Dice Roller - Network roll service
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# An asyncio server for chat bots and the like, which can serve many tables at
+# once from one process.  Clients send one JSON object per line, such as
+#   {"id": 1, "system": "World of Darkness 3rd Ed", "quantity": 7, "tn": 6}
+#   {"id": 2, "formula": "2d6+3"}
+# and get one JSON object per line back, in the same order, holding the result
+# (see engine.RollResult.asDict()) or an "error".  Any "id" is echoed back.
+# When run with --stats, {"stats": true} gets instrument.snapshot() back, for
+# seeing where the time is going.
+#
+# Requests that arrive in the same tick of the event loop are grouped by what
+# they're rolling, and each group is rolled with a single engine.rollMany().
+#
+# Usage: python server.py [--host HOST] [--port PORT] [--stats]
+
+import argparse
+import asyncio
+import json
+
+import engine
+import instrument
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5050
+
+# The biggest pool a single request may roll, and the most dice a Free Entry
+# formula may cost (see freeentry.py), so that one client can't stall every
+# other table.
+MAX_QUANTITY = 100000
+
+# The most sides a die may have.
+MAX_POLY = 1000000
+
+
+# Collects roll requests and rolls them in batches, once per tick of the event
+# loop.
+class RollBatcher:
+    # Constructor
+    def __init__(self):
+        self.pending = list()
+        self.scheduled = False
+
+    # Queue a roll, returning a future that will hold its RollResult.
+    def submit(self, params):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((params, future))
+        if not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self.flush)
+        return future
+
+    # Roll everything that's queued up, one engine call per distinct roll.
+    def flush(self):
+        pending = self.pending
+        self.pending = list()
+        self.scheduled = False
+
+        groups = dict()
+        for (params, future) in pending:
+            key = batchKey(params)
+            if key not in groups:
+                groups[key] = (params, list())
+            groups[key][1].append(future)
+
+        for (params, futures) in groups.values():
+            try:
+                results = engine.rollMany(params, len(futures))
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (future, result) in zip(futures, results):
+                # The client may have gone away in the meantime.
+                if not future.done():
+                    future.set_result(result)
+
+
+# Requests with the same key roll exactly the same thing, so can share a
+# batch.
+def batchKey(params):
+    if params.system.type == "Free Entry":
+        return (params.system.name, params.compiled.text)
+    return (params.system.name, params.quantity, params.poly, params.keep,\
+    params.tn, params.addition)
+
+
+# Refuse requests too big to roll without holding up everybody else.  A
+# formula's cost includes setting up each different size of die in it.
+def checkSize(params):
+    if params.system.type == "Free Entry":
+        cost = params.compiled.cost
+        polys = params.compiled.polys
+        poly = max(polys) if len(polys) > 0 else 0
+    else:
+        cost = params.quantity
+        poly = params.poly
+    if cost > MAX_QUANTITY:
+        raise ValueError("You can roll at most %d dice." % MAX_QUANTITY)
+    if poly > MAX_POLY:
+        raise ValueError("Dice can have at most %d sides." % MAX_POLY)
+
+
+# A response as a line of JSON, with the request's id if it had one.
+def encodeResponse(response, requestId):
+    if requestId is not None:
+        response["id"] = requestId
+    return json.dumps(response).encode("utf-8") + b"\n"
+
+
+# The roll service itself.
+class RollServer:
+    # Constructor
+    def __init__(self):
+        self.batcher = RollBatcher()
+
+    # Work out the response to one line from a client, as a line of JSON.
+    # Whatever is wrong with a request, the client gets an "error" back.
+    async def handleRequest(self, line):
+        requestId = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                requestId = request.get("id")
+            if isinstance(request, dict) and request.get("stats") == True:
+                if not instrument.enabled:
+                    raise ValueError("Statistics are switched off.")
+                response = instrument.snapshot()
+            else:
+                params = engine.parametersFromSpec(request)
+                checkSize(params)
+                result = await self.batcher.submit(params)
+                response = result.asDict()
+            return encodeResponse(response, requestId)
+        except ValueError as e:
+            error = str(e)
+        except Exception as e:
+            error = "Invalid request: %s" % e
+        return encodeResponse({"error": error}, requestId)
+
+    # Serve one client connection until it closes.
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip() == b"":
+                    continue
+                writer.write(await self.handleRequest(line))
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Start listening, returning the asyncio Server.
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handleConnection, host, port,\
+        backlog=4096)
+
+
+# Run the server until interrupted.
+async def serve(host, port):
+    server = await RollServer().start(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=\
+    "Serve dice rolls as JSON over TCP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--stats", action="store_true",\
+    help="record timings and counts, and serve them to {\"stats\": true}")
+    options = parser.parse_args(arguments)
+    if options.stats:
+        instrument.enable()
+    try:
+        asyncio.run(serve(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
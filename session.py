@@ -0,0 +1,140 @@
+# RPG Dice Roller - Seeded sessions
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Reproducible rolling.  A Session has a seed, and numbers its rolls from zero;
+# every roll gets its own stream of random numbers made from (seed, counter),
+# so any past roll can be replayed exactly from those two numbers and its
+# parameters, without replaying the rolls before it.
+#
+# The contract, which must not change without changing STREAM_VERSION:
+#   - Roll "counter" of session "seed" draws from a "seeded" rng.BufferedRNG
+#     seeded with "seed/counter" (see streamKey()) and a block size of
+#     SESSION_BLOCK_SIZE.  Values are made from that stream as described in
+#     rng.BufferedRNG.block(): one byte per die for up to 255 sides, with the
+#     bytes that would bias the result thrown away, in blocks per poly sized
+#     as rng.BufferedRNG.refill() says.
+#   - The initial pool is drawn first, all at once: as individual dice in
+#     order, or for pools of rng.COUNTED_POOL_THRESHOLD dice or more, as
+#     counts per face (rng.BufferedRNG.faceCounts()) or sums
+#     (rng.BufferedRNG.sumDice()).
+#   - Explosions are then rolled a generation at a time, in the order of the
+#     dice that exploded.
+#   - Free Entry formulas roll their sets of dice left to right, in the order
+#     they're written.
+#   - A group (see group.rollGroup()) is one roll.  Its Free Entry and huge
+#     pool members are rolled first, in order, as above; then each kind of
+#     member's initial dice are drawn in one go, in the order the kinds first
+#     appear, with each member's explosions rolled as it's scored.
+# Anything else (the System, quantity, TN and so on) comes from the
+# parameters, which are needed to replay a roll.
+
+import random
+import threading
+
+import engine
+import group
+import rng
+
+
+# Bump this if anything above changes, as old seeds will no longer replay.
+# Version 2 rolls huge Roll & Keep pools as counts per face.  Version 3
+# starts each poly's blocks small and doubles them, and rolls dice of more than
+# rng.MAX_BLOCK_POLY sides one at a time.
+STREAM_VERSION = 3
+
+# The largest block size of each roll's stream.  Most rolls use a handful of
+# dice, so this is much smaller than the default.
+SESSION_BLOCK_SIZE = 1024
+
+
+# The seed of the stream for one roll of a session.
+def streamKey(seed, counter):
+    return "%d/%d" % (seed, counter)
+
+
+# The source of random numbers for one roll of a session.
+def sourceFor(seed, counter):
+    source = rng.BufferedRNG(random.Random(streamKey(seed, counter)).randbytes,\
+    "seeded", seed, SESSION_BLOCK_SIZE)
+    source.counter = counter
+    source.streamVersion = STREAM_VERSION
+    return source
+
+
+# Refuse to replay a roll made under a different version of the stream
+# contract, which would give a different result rather than the same one.
+def checkStreamVersion(streamVersion):
+    if streamVersion is not None and streamVersion != STREAM_VERSION:
+        raise ValueError("That roll was made with stream version %d, but " %\
+        streamVersion + "this is version %d, so it can't be replayed." %\
+        STREAM_VERSION)
+
+
+# A series of reproducible rolls.  With no seed, a random one is chosen.
+class Session:
+    # Constructor
+    def __init__(self, seed=None, counter=0):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.counter = counter
+        # Rolls may be made from more than one thread (see worker.py), and
+        # no two may get the same counter.
+        self.lock = threading.Lock()
+
+    # Make the next roll of the session (see engine.roll()).  The result's
+    # "seed" and "counter" say how to replay it, and "streamVersion" which
+    # version of the contract above it was made under.  If given, "wrap" is
+    # called with the roll's source and returns one to draw from in its place
+    # that gives the same values, such as a worker.WatchedSource.  A roll
+    # stopped part way still uses up its counter.
+    def roll(self, params, wrap=None):
+        with self.lock:
+            counter = self.counter
+            self.counter = counter + 1
+        source = sourceFor(self.seed, counter)
+        if wrap is not None:
+            source = wrap(source)
+        result = engine.roll(params, source)
+        result.seed = self.seed
+        result.counter = counter
+        result.streamVersion = STREAM_VERSION
+        return result
+
+    # Roll a whole group (see group.py) as the next roll of the session,
+    # returning a group.GroupResult whose "seed", "counter" and
+    # "streamVersion" say how to replay it.  "wrap" is as for roll().
+    def rollGroup(self, members, wrap=None):
+        with self.lock:
+            counter = self.counter
+            self.counter = counter + 1
+        source = sourceFor(self.seed, counter)
+        if wrap is not None:
+            source = wrap(source)
+        result = group.rollGroup(members, source)
+        result.seed = self.seed
+        result.counter = counter
+        result.streamVersion = STREAM_VERSION
+        return result
+
+    # Make the next "times" rolls of the session.
+    def rollMany(self, params, times):
+        return [self.roll(params) for i in range(times)]
+
+    # Roll number "counter" again, giving exactly the same result as first
+    # time.  Given the stream version the roll was made with, a roll from a
+    # different version is refused (see checkStreamVersion()).  Replays aren't
+    # recorded in the roll log.
+    def replay(self, params, counter, streamVersion=None):
+        checkStreamVersion(streamVersion)
+        result = engine.rollOnce(params, sourceFor(self.seed, counter))
+        result.seed = self.seed
+        result.counter = counter
+        result.streamVersion = STREAM_VERSION
+        return result
+
+
+# Replay roll "counter" of the session with the given seed.
+def replay(params, seed, counter, streamVersion=None):
+    return Session(seed).replay(params, counter, streamVersion)
@@ -0,0 +1,109 @@
+# RPG Dice Roller - Monte Carlo simulation
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Rolls any System configuration millions of times across a pool of worker
+# processes and reports what happened, for balance testing house rules.
+#
+# Trials are split into fixed-size chunks, and each chunk gets its own RNG
+# stream seeded from (seed, chunk number).  Which worker runs which chunk
+# doesn't matter, so a given seed gives the same answer whatever the number of
+# workers.
+
+import multiprocessing
+import random
+
+import engine
+import rng
+
+
+# How many trials each worker does at a time.
+CHUNK_SIZE = 10000
+
+
+# The aggregated results of a simulation.  "totals" and "successes" map each
+# total / number of successes seen to how many times it came up, and
+# "outcomes" counts the overall "Success", "Failure" and "Botch" results.
+class SimulationResult:
+    # Constructor
+    def __init__(self):
+        self.trials = 0
+        self.totals = dict()
+        self.successes = dict()
+        self.outcomes = {"Success": 0, "Failure": 0, "Botch": 0}
+
+    # Fold in another set of results.
+    def merge(self, other):
+        self.trials = self.trials + other.trials
+        for (value, count) in other.totals.items():
+            self.totals[value] = self.totals.get(value, 0) + count
+        for (value, count) in other.successes.items():
+            self.successes[value] = self.successes.get(value, 0) + count
+        for (outcome, count) in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes[outcome] + count
+
+    def successRate(self):
+        return self.rate("Success")
+
+    def botchRate(self):
+        return self.rate("Botch")
+
+    def failureRate(self):
+        return self.rate("Failure")
+
+    # The fraction of trials with the given outcome.
+    def rate(self, outcome):
+        if self.trials == 0:
+            return 0.0
+        return float(self.outcomes[outcome]) / self.trials
+
+
+# The seed for a particular chunk's RNG stream.
+def chunkSeed(seed, chunk):
+    return "%s/%d" % (seed, chunk)
+
+
+# Run one chunk of trials.  This is what the worker processes do.
+def simulateChunk(work):
+    (params, seed, chunk, trials) = work
+    source = rng.createRNG("seeded", chunkSeed(seed, chunk))
+    result = SimulationResult()
+    result.trials = trials
+    totals = result.totals
+    successes = result.successes
+    outcomes = result.outcomes
+    for roll in engine.rollMany(params, trials, source):
+        if roll.total is not None:
+            totals[roll.total] = totals.get(roll.total, 0) + 1
+        if roll.system.type == "Success-based":
+            successes[roll.successes] = successes.get(roll.successes, 0) + 1
+        if roll.outcome is not None:
+            outcomes[roll.outcome] = outcomes[roll.outcome] + 1
+    return result
+
+
+# Simulate a number of trials of a set of engine.RollParameters (or
+# engine.FreeEntryParameters).  With no seed, a random one is chosen.  With no
+# worker count, one worker is used per CPU.
+def simulate(params, trials, seed=None, workers=None, chunkSize=CHUNK_SIZE):
+    if seed is None:
+        seed = random.getrandbits(64)
+    work = list()
+    for chunk in range((trials + chunkSize - 1) // chunkSize):
+        count = min(chunkSize, trials - chunk * chunkSize)
+        work.append((params, seed, chunk, count))
+
+    result = SimulationResult()
+    if workers == 1 or len(work) <= 1:
+        for item in work:
+            result.merge(simulateChunk(item))
+        return result
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for chunkResult in pool.imap_unordered(simulateChunk, work):
+            result.merge(chunkResult)
+    finally:
+        pool.close()
+        pool.join()
+    return result
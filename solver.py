@@ -0,0 +1,202 @@
+# RPG Dice Roller - Inverse solver
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Answers "what do I need?" questions for encounter design, such as "how many
+# dice for a 90% chance of 3+ successes on New World of Darkness?" or "what
+# keep makes 7th Sea 8k? beat TN 30 half the time?".  One of the quantity, TN
+# or keep is searched for, with everything else given.
+#
+# The chance of success only ever moves one way as any of these goes up, so
+# the search gallops and then bisects over whole numbers, using the exact odds
+# from probability.py, which remembers every configuration it has worked out.
+# A search takes a handful of evaluations, and asking again is free.  Only
+# values whose odds are cheap enough to work out (see odds.hasOdds()) are
+# searched, so no single evaluation can run away.
+
+import engine
+import odds
+import probability
+
+
+# What can be searched for, and what to call each.
+VARIABLES = ("quantity", "tn", "keep")
+LABELS = {"quantity": "Dice to roll", "tn": "Target number",\
+"keep": "Dice to keep"}
+
+# The biggest pool the solver will consider, on top of the limit on the work
+# of working out its odds.
+MAX_QUANTITY = 1000
+
+# Explosions can take totals past quantity * poly; TNs are searched up to this
+# many times that.
+EXPLODING_TN_FACTOR = 4
+
+
+# The answer to a question: the value found, and the chance of success that it
+# gives.
+class Solution:
+    # Constructor
+    def __init__(self, variable, value, chance):
+        self.variable = variable
+        self.value = value
+        self.chance = chance
+
+    def describe(self):
+        return "%s: %d (a %.1f%% chance)." % (LABELS[self.variable],\
+        self.value, 100 * self.chance)
+
+
+# The variables that can be searched for with a System: those it doesn't fix
+# and that it uses.
+def variablesFor(system):
+    variables = list()
+    if system.type == "Free Entry":
+        return variables
+    if system.fixQuantity < 0:
+        variables.append("quantity")
+    if system.fixTN < 0 and system.rollOverUnder != "NoTN":
+        variables.append("tn")
+    if system.type == "Roll & Keep" and system.fixKeep < 0:
+        variables.append("keep")
+    return variables
+
+
+# The chance of success of a roll, where success means getting at least
+# "successes" successes if given (Success-based systems only), or otherwise
+# succeeding against the TN.
+def chanceOf(params, successes=None):
+    distribution = probability.distributionFor(params)
+    if successes is not None:
+        if params.system.type != "Success-based":
+            raise ValueError("Only Success-based systems count successes.")
+        return distribution.atLeast(successes)
+    if distribution.success is None:
+        raise ValueError("%s has no target to beat." % params.system.name)
+    return distribution.success
+
+
+# The range of values to search for a variable, given the other values.
+def searchRange(system, variable, values):
+    if variable == "quantity":
+        return (1, MAX_QUANTITY)
+    if variable == "keep":
+        if system.type != "Roll & Keep":
+            raise ValueError("Only Roll & Keep systems keep dice.")
+        return (1, values["quantity"])
+    if system.type == "Success-based":
+        return (1, values["poly"])
+    dice = values["quantity"]
+    if system.type == "Roll & Keep":
+        dice = min(values["keep"], dice)
+    high = dice * values["poly"]
+    if system.maxExplodes == True:
+        high = high * EXPLODING_TN_FACTOR
+    return (1 + values["addition"], high + values["addition"])
+
+
+# Find the value of "variable" ("quantity", "tn" or "keep") that gives at
+# least the given chance of success (see chanceOf()) when rolling "system"
+# with the other values given.  Where more is better (more dice, or a lower
+# TN when rolling over), the smallest value that does is found; where less is
+# better, the largest.  Values the System fixes can't be searched for.
+# Returns a Solution, or None if no value in range gives the chance asked for.
+def solve(system, variable, chance, quantity=None, poly=None, keep=None,\
+tn=None, addition=0, successes=None):
+    if variable not in VARIABLES:
+        raise ValueError("Can only search for %s." % ", ".join(VARIABLES))
+    fixed = {"quantity": system.fixQuantity, "tn": system.fixTN,\
+    "keep": system.fixKeep}[variable]
+    if fixed >= 0:
+        raise ValueError("%s fixes the %s at %d." % (system.name, variable,\
+        fixed))
+    if variable == "tn" and system.rollOverUnder == "NoTN":
+        raise ValueError("%s has no target to beat." % system.name)
+    if chance < 0.0 or chance > 1.0:
+        raise ValueError("The chance must be between 0 and 1.")
+
+    # Check the other values by building the parameters with a stand-in for
+    # the one being searched for.
+    values = {"quantity": quantity, "poly": poly, "keep": keep, "tn": tn,\
+    "addition": addition}
+    values[variable] = 1
+    params = engine.RollParameters(system, values["quantity"],\
+    values["poly"], values["keep"], values["tn"], values["addition"])
+    values = {"quantity": params.quantity, "poly": params.poly,\
+    "keep": params.keep, "tn": params.tn, "addition": params.addition}
+    (low, high) = searchRange(system, variable, values)
+
+    # The parameters for a value of the variable.
+    def paramsAt(value):
+        values[variable] = value
+        return engine.RollParameters(system, values["quantity"],\
+        values["poly"], values["keep"], values["tn"], values["addition"])
+
+    # Search only as far as the odds can be worked out.  The work never goes
+    # down as the quantity or keep goes up, and doesn't depend on the TN.
+    tooBig = lambda value : not odds.hasOdds(paramsAt(value))
+    if tooBig(low):
+        raise ValueError("That roll is too big to work out the odds of.")
+    if variable != "tn":
+        limit = firstWhere(tooBig, low, high)
+        if limit is not None:
+            high = limit - 1
+
+    # The chance for a value of the variable.
+    def chanceAt(value):
+        return chanceOf(paramsAt(value), successes)
+
+    good = lambda value : chanceAt(value) >= chance
+    if moreIsBetter(system, variable):
+        value = firstWhere(good, low, high)
+    else:
+        value = firstWhere(lambda value : not good(value), low, high)
+        if value is None:
+            value = high
+        elif value == low:
+            value = None
+        else:
+            value = value - 1
+    if value is None:
+        return None
+    return Solution(variable, value, chanceAt(value))
+
+
+# Whether raising a variable makes success more likely.  More dice means more
+# successes, or more dice to keep the best of, but a bigger Overall Target
+# total, which is worse when rolling under.  Keeping more dice also makes a
+# bigger total.  A higher TN is only better when rolling under.
+def moreIsBetter(system, variable):
+    under = system.rollOverUnder == "Under"
+    if variable == "quantity":
+        return system.type != "Overall Target" or not under
+    if variable == "keep":
+        return not under
+    return under
+
+
+# The first whole number from low to high for which test() is true, given that
+# it's false up to some point and true from then on, or None if it's never
+# true.  We gallop up from low, doubling the step each time, and then bisect,
+# so that small answers don't need the (slowest) big values looked at.
+def firstWhere(test, low, high):
+    if test(low):
+        return low
+    bad = low
+    step = 1
+    while True:
+        probe = min(bad + step, high)
+        if test(probe):
+            good = probe
+            break
+        if probe == high:
+            return None
+        bad = probe
+        step = step * 2
+    while good - bad > 1:
+        middle = (good + bad) // 2
+        if test(middle):
+            good = middle
+        else:
+            bad = middle
+    return good
@@ -0,0 +1,325 @@
+# RPG Dice Roller - System definitions
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# The Roleplaying game systems known to the roller, and the registry that
+# loads them from systems.json.  Nothing in here depends on wx, so the roll
+# engine can use it without a GUI.
+
+import json
+import os
+import sys
+
+
+# Where the built-in Systems are defined.  Each entry gives the parameters
+# described below, by name.
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+"systems.json")
+
+# The parameters of a System, in constructor order, and which of them are
+# true/false flags.
+FIELDS = ("name", "family", "type", "fixQuantity", "fixPoly", "fixKeep",\
+"fixTN", "rollOverUnder", "minIsBotch", "minIsMinusSuccess", "maxExplodes",\
+"maxIsDouble", "maxIsSuccess", "allowAddition")
+FLAGS = FIELDS[8:]
+
+TYPES = ("Overall Target", "Success-based", "Roll & Keep", "Free Entry")
+
+
+# Define a Roleplaying game system.  The meanings of each input parameter are as
+# follows:
+#   NAME: A unique name for the system.
+#   FAMILY: The family of the system, e.g. "Storyteller".  For categorisation
+#           only.
+#   TYPE: "Overall Target" (D&D-esque), "Success-based" (Storyteller-esque),
+#         "Roll & Keep" (7th Sea-esque), or "Free Entry".
+#   FIXED QUANTITY: Make the user roll this many dice.  -1 = no restriction.
+#   FIXED POLY: Make the user roll dice of this many sides.  -1 = no
+#               restriction.
+#   FIXED KEEP: Make the user keep only this many dice in a Roll & Keep.  -1 = 
+#               no restriction.
+#   FIXED TN: Fix the target number.  This is per die in "Success-based" and for
+#             the total otherwise.  -1 = no restriction.
+#   ROLL OVER/UNDER: Determines whether rolling over or under the TN is a
+#                    success (per die, or overall).  "Over" and "Under" are
+#                    obvious, "NoTN" means don't worry about success or failure,
+#                    we just want the sum of the dice.  (This keeps d20 damage
+#                    rolls in the "Overall Target" family.)  In the "Roll &
+#                    Keep" family, it is assumed you keep the highest dice if
+#                    this is "Over", and the lowest if this is "Under".
+#   MIN IS BOTCH: Getting a 1 marks that die as a botch.  This also covers
+#                 Natural 1s in d20.  Ignored in "Roll & Keep".  In
+#                 "Success-based", the whole roll is only a botch if there are
+#                 individual botches and there are no individual successes.
+#   MIN IS -1 SUCCESS: Any 1s rolled subtract one from your number of successes.
+#                      Only used in "Success-based".  Enable both this and the
+#                      previous parameter (MIN IS BOTCH) to use the WoD 1st /
+#                      2nd Ed behaviour whereby you can botch if you have more
+#                      individual botches than individual successes (as opposed
+#                      to the traditional behaviour whereby so long as you have
+#                      at least one success, you're safe).
+#   MAX EXPLODES: Any dice that get the maximum roll are rolled again, and the
+#                 values added (Overall Target, Roll & Keep) or the successes
+#                 added (Success-based).
+#   MAX IS DOUBLE: Any dice that get the maximum roll count for two successes.
+#                  Only used in "Success-based".
+#   MAX IS SUCCESS: Any dice that get the maximum roll are successes, regardless
+#                   of whether the TN was actually achievable or not.  This is
+#                   only really for Natural 20s in d20.  Not in "Roll & Keep".
+#   ALLOW ADDITION: Give the user the ability to add or subtract from the end of
+#                   the roll, e.g. for 2d6+1.  "Overall Target" only.
+class System:
+    __slots__ = FIELDS
+
+    # Constructor
+    def __init__(self,name,family,type,fixQuantity,fixPoly,fixKeep,fixTN,\
+    rollOverUnder,minIsBotch,minIsMinusSuccess,maxExplodes,maxIsDouble,\
+    maxIsSuccess,allowAddition):
+        self.name = name
+        self.family = family
+        self.type = type
+        self.fixQuantity = fixQuantity
+        self.fixPoly = fixPoly
+        self.fixKeep = fixKeep
+        self.fixTN = fixTN
+        self.rollOverUnder = rollOverUnder
+        self.minIsBotch = minIsBotch
+        self.minIsMinusSuccess = minIsMinusSuccess
+        self.maxExplodes = maxExplodes
+        self.maxIsDouble = maxIsDouble
+        self.maxIsSuccess = maxIsSuccess
+        self.allowAddition = allowAddition
+
+    # When converted to a string, the System will report its name.
+    def __str__(self):
+        return "%s" % self.name
+
+    # The System's definition as a tuple of its parameters, in constructor
+    # order.
+    def definition(self):
+        return tuple([getattr(self, field) for field in FIELDS])
+
+
+# Check a System for parameter values and flag combinations that don't make
+# sense, returning a list of the problems found.
+def validateSystem(system):
+    problems = list()
+    if system.type not in TYPES:
+        problems.append("unknown type %s" % system.type)
+    if system.rollOverUnder not in ("Over", "Under", "NoTN"):
+        problems.append("rollOverUnder must be Over, Under or NoTN")
+    for field in ("fixQuantity", "fixPoly", "fixKeep", "fixTN"):
+        value = getattr(system, field)
+        if not isinstance(value, int) or isinstance(value, bool) or\
+        value < -1:
+            problems.append("%s must be a whole number, or -1" % field)
+    for field in FLAGS:
+        if not isinstance(getattr(system, field), bool):
+            problems.append("%s must be true or false" % field)
+    if len(problems) > 0:
+        return problems
+
+    if system.type == "Free Entry":
+        for field in FLAGS:
+            if getattr(system, field) == True:
+                problems.append("%s means nothing in Free Entry" % field)
+        return problems
+    if system.fixQuantity == 0:
+        problems.append("fixQuantity of 0 leaves nothing to roll")
+    if system.fixPoly == 0:
+        problems.append("fixPoly of 0 makes dice with no sides")
+    if system.fixPoly == 1 and system.maxExplodes == True:
+        problems.append("one-sided dice with maxExplodes explode forever")
+    if system.type == "Success-based" and system.rollOverUnder == "NoTN":
+        problems.append("Success-based systems need a TN to count successes")
+    if system.type != "Success-based":
+        if system.minIsMinusSuccess == True:
+            problems.append("minIsMinusSuccess is only for Success-based")
+        if system.maxIsDouble == True:
+            problems.append("maxIsDouble is only for Success-based")
+    if system.type == "Roll & Keep":
+        if system.maxIsSuccess == True:
+            problems.append("maxIsSuccess is not used in Roll & Keep")
+        if system.fixKeep == 0:
+            problems.append("fixKeep of 0 keeps nothing")
+        if system.fixQuantity > 0 and system.fixKeep > system.fixQuantity:
+            problems.append("fixKeep is more than fixQuantity")
+    elif system.fixKeep >= 0:
+        problems.append("fixKeep is only for Roll & Keep")
+    if system.type != "Overall Target" and system.allowAddition == True:
+        problems.append("allowAddition is only for Overall Target")
+    return problems
+
+
+# All the Systems the roller knows about, loaded from one or more data files.
+# Files are only read when something first asks for a System, and each
+# definition is only turned into a System (and checked) when it's first
+# needed.  Systems are kept in the order they appear in the files, and can be
+# looked up by name or family directly.
+class Registry:
+    # Constructor
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.loaded = False
+        self.order = list()
+        self.definitions = dict()
+        self.parsed = dict()
+        self.families = dict()
+
+    # Add another data file, e.g. of house rules.
+    def addFile(self, path):
+        self.paths.append(path)
+        if self.loaded:
+            self.loadFile(path)
+
+    # Read the data files, indexing each definition by name and family.
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        for path in self.paths:
+            self.loadFile(path)
+
+    def loadFile(self, path):
+        dataFile = open(path)
+        try:
+            definitions = json.load(dataFile)
+        finally:
+            dataFile.close()
+        for definition in definitions:
+            name = definition.get("name")
+            if name in self.definitions:
+                raise ValueError("%s: %s is defined twice." % (path, name))
+            self.order.append(name)
+            self.definitions[name] = definition
+            family = definition.get("family")
+            if family not in self.families:
+                self.families[family] = list()
+            self.families[family].append(name)
+
+    # Get a System by name.
+    def get(self, name):
+        self.load()
+        if name not in self.parsed:
+            if name not in self.definitions:
+                raise ValueError("Unknown system %s." % name)
+            system = parseSystem(self.definitions[name])
+            problems = validateSystem(system)
+            if len(problems) > 0:
+                raise ValueError("%s: %s." % (name, "; ".join(problems)))
+            self.parsed[name] = system
+        return self.parsed[name]
+
+    # Get a System by its name or a short form of it, as typed on a command
+    # line: any case, with words shortened to their first letters or run
+    # together as initials (so "wod 3rd ed" is "World of Darkness 3rd Ed").
+    # Short forms of the start of a name are accepted too ("exalted"), if
+    # nothing matches the whole of a name.
+    def lookup(self, name):
+        if name in self:
+            return self.get(name)
+        words = name.lower().split()
+        matches = [candidate for candidate in self.order\
+        if abbreviates(words, candidate.lower().split(), True)]
+        if len(matches) == 0:
+            matches = [candidate for candidate in self.order\
+            if abbreviates(words, candidate.lower().split(), False)]
+        if len(matches) == 0:
+            raise ValueError("Unknown system %s." % name)
+        if len(matches) > 1:
+            raise ValueError("%s could be any of: %s." % (name,\
+            ", ".join(matches)))
+        return self.get(matches[0])
+
+    # The names of all the Systems, in order.
+    def names(self):
+        self.load()
+        return list(self.order)
+
+    # The names of all the families, in order of first appearance.
+    def familyNames(self):
+        self.load()
+        return list(self.families.keys())
+
+    # The Systems in a family, in order.
+    def inFamily(self, family):
+        self.load()
+        return [self.get(name) for name in self.families[family]]
+
+    # Check every definition, returning a list of the problems found.
+    def validate(self):
+        self.load()
+        problems = list()
+        for name in self.order:
+            try:
+                self.get(name)
+            except (ValueError, TypeError) as e:
+                problems.append(str(e))
+        return problems
+
+    def __contains__(self, name):
+        self.load()
+        return name in self.definitions
+
+    def __iter__(self):
+        return iter([self.get(name) for name in self.names()])
+
+    def __len__(self):
+        self.load()
+        return len(self.order)
+
+
+# Whether a list of (lower case) words is a short form of a name's words.  Each
+# word must either start the next word of the name or be the initials of the
+# next few words.  If "whole" is True, every word of the name must be used.
+def abbreviates(words, nameWords, whole):
+    if len(words) == 0:
+        return len(nameWords) == 0 or not whole
+    if len(nameWords) == 0:
+        return False
+    word = words[0]
+    if nameWords[0].startswith(word) and\
+    abbreviates(words[1:], nameWords[1:], whole):
+        return True
+    for length in range(2, min(len(word), len(nameWords)) + 1):
+        initials = "".join([nameWord[0] for nameWord in nameWords[0:length]])
+        if word == initials and abbreviates(words[1:], nameWords[length:],\
+        whole):
+            return True
+    return False
+
+
+# Turn a definition from a data file into a System.
+def parseSystem(definition):
+    missing = [field for field in FIELDS if field not in definition]
+    unknown = [field for field in definition if field not in FIELDS]
+    if len(missing) > 0:
+        raise ValueError("%s: missing %s." % (definition.get("name"),\
+        ", ".join(missing)))
+    if len(unknown) > 0:
+        raise ValueError("%s: unknown %s." % (definition.get("name"),\
+        ", ".join(unknown)))
+    return System(*[definition[field] for field in FIELDS])
+
+
+# The Systems that come with the roller.  House rules can be added with
+# registry.addFile().
+registry = Registry([DATA_FILE])
+
+
+# Look up a System by name.
+def findSystem(name):
+    return registry.get(name)
+
+
+# Check the data files given on the command line (or the built-in one) and
+# report any problems.
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        registry = Registry(sys.argv[1:])
+    problems = registry.validate()
+    for problem in problems:
+        print(problem)
+    if len(problems) == 0:
+        print("%d systems OK." % len(registry))
+    sys.exit(1 if len(problems) > 0 else 0)
@@ -0,0 +1,165 @@
+# RPG Dice Roller - Background work
+# by Ian Renton
+# This code is licenced under the Creative Commons.
+# See http://www.marmablue.co.uk/?q=node/2094 for details.
+# Runs long rolls (and anything else slow) on a worker thread, so that a GUI
+# stays responsive while they happen.  Nothing in here depends on wx: results,
+# errors and progress are handed back through a "post" function, which for
+# wxPython is wx.CallAfter so that they arrive on the event thread.
+#
+# The engine is pure Python, so the worker shares the interpreter with the
+# event thread; Python switches between them every few milliseconds, which is
+# plenty to keep the window moving.  Small rolls aren't worth a thread at all,
+# and should just be rolled (see runsInBackground()).  Big ones are rolled from
+# a WatchedSource, which reports progress and stops the roll when the job is
+# cancelled.
+
+import threading
+
+import rng
+
+
+# Rolls that draw fewer random values than this are quick enough to roll on
+# the spot.
+SYNCHRONOUS_COST = 20000
+
+
+# Raised inside a job's work when it has been cancelled.
+class Cancelled(Exception):
+    pass
+
+
+# A piece of work running on its own thread.  "work" is called with the job,
+# and can call job.progress() to report how far it's got and
+# job.checkCancelled() to stop early if it's been cancelled.  When it's done,
+# onDone(result) or onError(exception) is called through "post", unless the
+# job was cancelled first, in which case nothing is.  Either way, onFinished()
+# is then called through "post" once the thread has stopped working, for
+# callers that mustn't start anything else until it has.
+class BackgroundJob:
+    # Constructor
+    def __init__(self, work, onDone, onError, post, onProgress=None,\
+    onFinished=None):
+        self.work = work
+        self.onDone = onDone
+        self.onError = onError
+        self.onProgress = onProgress
+        self.onFinished = onFinished
+        self.post = post
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Stop caring about the result.  Work that doesn't check for cancellation
+    # carries on until it finishes, but its result is thrown away.
+    def cancel(self):
+        self.cancelled = True
+
+    # Report that the given fraction of the work is done.
+    def progress(self, fraction):
+        if self.onProgress is not None and not self.cancelled:
+            self.post(self.deliver, self.onProgress, fraction)
+
+    def checkCancelled(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    # The body of the worker thread.
+    def run(self):
+        try:
+            result = self.work(self)
+            self.post(self.deliver, self.onDone, result)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.post(self.deliver, self.onError, e)
+        if self.onFinished is not None:
+            self.post(self.onFinished)
+
+    # Hand something back, on whichever thread "post" runs it on, unless the
+    # job was cancelled in the meantime.
+    def deliver(self, callback, value):
+        if not self.cancelled:
+            callback(value)
+
+
+# A source of rolls (see rng.py) that watches a job as it's drawn from: before
+# each draw, the job stops if it has been cancelled, and otherwise hears how
+# much of "cost" random values (see rollCost()) have been drawn so far.  Every
+# draw of a roll goes through the source, between pools, explosion
+# generations and Free Entry terms, so that's where a roll can stop.  The
+# values drawn are the source's own, so seeded rolls are unchanged.
+class WatchedSource:
+    # Constructor
+    def __init__(self, source, job, cost):
+        self.source = source
+        self.job = job
+        self.cost = max(cost, 1)
+        self.drawn = 0
+        self.reported = 0
+
+    # Anything else, such as the seed, is the source's.
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    def draw(self, poly, count):
+        self.watch(count)
+        return self.source.draw(poly, count)
+
+    def randint(self, poly):
+        self.watch(1)
+        return self.source.randint(poly)
+
+    def faceCounts(self, poly, count):
+        self.watch(min(poly, count))
+        return self.source.faceCounts(poly, count)
+
+    def sumDice(self, poly, count):
+        self.watch(min(poly, count))
+        return self.source.sumDice(poly, count)
+
+    # Stop if the job's been cancelled, and report progress a percent at a
+    # time, so as not to flood "post".  Explosions can take a roll past its
+    # cost, in which case progress stays at the end.
+    def watch(self, cost):
+        self.job.checkCancelled()
+        self.drawn = self.drawn + cost
+        percent = min(100, self.drawn * 100 // self.cost)
+        if percent > self.reported:
+            self.reported = percent
+            self.job.progress(percent / 100.0)
+
+
+# Roughly how many random values a roll will draw, not counting explosions.
+def rollCost(params):
+    system = params.system
+    if system.type == "Free Entry":
+        return params.compiled.cost
+    if params.quantity >= rng.COUNTED_POOL_THRESHOLD:
+        if system.type == "Success-based" and\
+        params.poly <= rng.MAX_COUNTED_POLY:
+            return params.poly
+        if system.type == "Overall Target":
+            return min(params.poly, rng.MAX_COUNTED_POLY)
+        if system.type == "Roll & Keep" and\
+        params.poly <= rng.MAX_COUNTED_POLY:
+            return params.poly + params.keep
+    return params.quantity
+
+
+# Roughly how many random values rolling a group (see group.py) will draw.
+def groupCost(members):
+    return sum([rollCost(member.params) for member in members])
+
+
+# Whether a roll is big enough to be worth rolling in the background.
+def runsInBackground(params):
+    return rollCost(params) >= SYNCHRONOUS_COST
+
+
+# The same for a group.
+def groupRunsInBackground(members):
+    return groupCost(members) >= SYNCHRONOUS_COST